@@ -0,0 +1,26 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nba', '0030_optimizationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DraftGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dk_id', models.IntegerField(unique=True)),
+                ('sport', models.CharField(choices=[('NBA', 'NBA'), ('MLB', 'MLB'), ('NFL', 'NFL'), ('NHL', 'NHL')], max_length=4)),
+                ('csv_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('slate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='nba.slate')),
+            ],
+        ),
+    ]
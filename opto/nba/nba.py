@@ -4,6 +4,7 @@ from .utils import player_mappings
 from fuzzywuzzy import fuzz
 from codecs import iterdecode
 import random
+from opto.result_cache import invalidate_slate
 
 
 def store_opto_settings(user, slate, settings):
@@ -33,7 +34,7 @@ def update_default_projections(slate, projections):
     # Accept csv
     csv = DictReader(iterdecode(projections, 'utf-8'))
     this_slate = Slate.objects.get(pk=slate)  # Set slate
-    all_players = Player.objects.filter(slate=this_slate)
+    all_players = Player.objects.filter(slate=this_slate, active=True)
     # Reset projections
     for player in all_players:
         player.projection = 0
@@ -43,7 +44,7 @@ def update_default_projections(slate, projections):
         player_name = row['Player']
         try:
             # Check if there is a perfect match
-            player = Player.objects.get(name=player_name, slate=this_slate)
+            player = Player.objects.get(name=player_name, slate=this_slate, active=True)
         except:
             # Check if there is a sudo-match
             # Check known player mappings
@@ -51,7 +52,7 @@ def update_default_projections(slate, projections):
                 meta_player_name = player_mappings[player_name]
                 try:
                     player = Player.objects.get(
-                        name=meta_player_name, slate=slate)
+                        name=meta_player_name, slate=slate, active=True)
                 except:
                     continue
             for each_player in all_players:
@@ -87,6 +88,7 @@ def update_default_projections(slate, projections):
         # Store perfect match
         player.projection = row['Proj']
         player.save()
+    invalidate_slate('NBA', this_slate.id)
     return True
 
 
@@ -95,7 +97,7 @@ def get_slate_info(request, slate_id, user=None):
         slate = Slate.objects.get(id=slate_id)
         games = Game.objects.filter(slate=slate)
         teams = Team.objects.filter(slate=slate)
-        players = Player.objects.filter(slate=slate)
+        players = Player.objects.filter(slate=slate, active=True)
         game_info = []
         for game in games:
             game_info.append(
@@ -8,6 +8,13 @@ urlpatterns = [
          views.get_unauthenticated_slate_info, name='unauthenticated-slate-info'),
     path('api/authenticated-optimize/', views.authenticated_optimize,
          name='authenticated-optimize'),
+    path('api/optimize/', views.optimize, name='optimize'),
+    path('api/late-swap/', views.late_swap, name='late-swap'),
+    path('api/simulate/', views.simulate, name='simulate'),
+    path('api/contest-sim/', views.simulate_contest, name='contest-sim'),
+    path('api/jobs/', views.submit_job, name='submit-job'),
+    path('api/jobs/<int:job_id>', views.job_status, name='job-status'),
+    path('api/jobs/<int:job_id>/result', views.job_result, name='job-result'),
     path('api/authenticated-slate-info/<int:slate_id>',
          views.get_authenticated_slate_info, name='authenticated-slate-info'),
     path('api/user-opto-settings/', views.user_opto_settings,
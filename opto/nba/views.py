@@ -1,25 +1,26 @@
 import json
 import re
-from collections import defaultdict
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import Slate, Team, Player, Game, UserOptoSettings, UserPlayer, Optimization, ContestResults
+from .models import Slate, Player, UserOptoSettings, UserPlayer, Optimization, OptimizationJob, ContestResults
 from rest_framework import status
 from opto.utils import format_slate
+from opto.dk_csv import parse_dk_csv
+from opto.slate_ingest import create_slate, jitter_projections
+from opto.uploads import iter_upload_rows, projection_rows, apply_projections
 from csv import DictReader
-from codecs import iterdecode
-from datetime import datetime
-from nba.nba import get_slate_info, update_default_projections, randomize_within_percentage
+from nba.nba import invalidate_slate, get_slate_info, update_default_projections
+from opto.slate_builds import optimize_slate, simulate_slate, late_swap_optimization, contest_slate
+from opto.optimizer import MAX_LINEUPS, MAX_SYNC_LINEUPS
+from opto.simulation import DEFAULT_SOLVES, MAX_SIMULATIONS, MAX_SOLVES, MAX_SYNC_SIMULATIONS, MAX_SYNC_SOLVES
+from opto.stacking import parse_stacks
+from opto.portfolio import MAX_PORTFOLIO_POOL
+from opto.bitsets import duplicate_counts
+from opto.contest import MAX_FIELD_SIZE
 from rest_framework.decorators import authentication_classes
 from rest_framework.authentication import TokenAuthentication
-from fuzzywuzzy import fuzz
 from .utils import player_mappings, banned_mappings
-import openpyxl
 from datetime import datetime, timedelta, timezone
-try:
-    from zoneinfo import ZoneInfo
-except ImportError:
-    from backports.zoneinfo import ZoneInfo
 
 
 @api_view(['GET'])
@@ -62,154 +63,19 @@ def upload_projections(request):
     if method != 'file' and method != 'paste':
         return Response({"error": "Invalid method"}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        # File Upload
         if method == 'file':
-            # Get uploaded csv file
+            # Rows are streamed from the upload and stored in batches
             slate_file = request.FILES.get('file')
-            if slate_file.name.endswith('.xlsx'):
-                # Convert XLSX to CSV
-                workbook = openpyxl.load_workbook(slate_file)
-                sheet = workbook.active
-                csv_text = "\n".join([",".join(map(str, row))
-                                     for row in sheet.iter_rows(values_only=True)])
-            else:
-                # Read as CSV if it's not an XLSX file
-                csv_text = slate_file.read().decode('utf-8-sig')
-            csv = DictReader(csv_text.splitlines())
+            rows = projection_rows(iter_upload_rows(slate_file))
         elif method == 'paste':
             paste_projections = request.data['paste-projections']
             projections = json.loads(paste_projections)
-        slate = Slate.objects.get(id=int(request.data['slate']))
-        user = request.user
-        all_players = Player.objects.filter(slate=slate)
-        unfound_players = []
-        assumed_players = {}
-        all_player_data = ''
-        if method == 'file':
-            all_player_data = csv
-        elif method == 'paste':
-            all_player_data = projections
-            if len(all_player_data) > 2000:
+            if len(projections) > 2000:
                 return Response({"error": "File too large"}, status=status.HTTP_400_BAD_REQUEST)
-        # Gather player info
-        for row in all_player_data:
-            if method == 'file':
-                try:
-                    player_name = row['Player']
-                except:
-                    player_name = row['player']
-                try:
-                    player_projection = float(row['Projection'])
-                except:
-                    player_projection = float(row['projection'])
-            elif method == 'paste':
-                player_name = row
-                player_projection = float(all_player_data[row])
-
-            try:
-                # Perfect Match
-                meta_player = Player.objects.get(name=player_name, slate=slate)
-                try:
-                    # Check if there is already a user player
-                    player = UserPlayer.objects.get(
-                        slate=slate, user=user, meta_player=meta_player)
-                    player.projection = player_projection
-                    player.save()
-                except:
-                    player = UserPlayer.objects.create(
-                        slate=slate, user=user, meta_player=meta_player, lock=False, remove=False, ownership=0, exposure=100, projection=player_projection)
-                    player.save()
-            except:
-                player_found = False
-                # Check known player mappings
-                if player_name in player_mappings:
-                    meta_player_name = player_mappings[player_name]
-                    try:
-                        meta_player = Player.objects.get(
-                            name=meta_player_name, slate=slate)
-                    except:
-                        continue
-                    try:
-                        # Check if there is already a user player
-                        player = UserPlayer.objects.get(
-                            slate=slate, user=user, meta_player=meta_player)
-                        player.projection = player_projection
-                        assumed_players[player_name] = meta_player.name
-                        player_found = True
-                        player.save()
-                        continue
-                    except:
-                        player = UserPlayer.objects.create(
-                            slate=slate, user=user, meta_player=meta_player, lock=False, remove=False, ownership=0, exposure=100, projection=player_projection)
-                        assumed_players[player_name] = meta_player.name
-                        player_found = True
-                        player.save()
-                        continue
-                for each_player in all_players:
-                    # Check un-altered names
-                    ratio = fuzz.ratio(each_player.name, player_name)
-                    if ratio > 85:
-                        # Store sudo match
-                        meta_player = each_player
-                        if player_name in banned_mappings:
-                            if each_player.name == banned_mappings[player_name]:
-                                continue
-                        try:
-                            # Check if there is already a user player
-                            player = UserPlayer.objects.get(
-                                slate=slate, user=user, meta_player=meta_player)
-                            player.projection = player_projection
-                            assumed_players[player_name] = meta_player.name
-                            player_found = True
-                            player.save()
-                            break
-                        except:
-                            player = UserPlayer.objects.create(
-                                slate=slate, user=user, meta_player=meta_player, lock=False, remove=False, ownership=0, exposure=100, projection=player_projection)
-                            assumed_players[player_name] = meta_player.name
-                            player_found = True
-                            player.save()
-                            break
-
-                    # Check altered names
-                    # Alter first name
-                    stripped_db_name = ""
-                    for ch in each_player.name:
-                        if ch.isalpha():
-                            stripped_db_name += ch
-                    # # Alter second name
-                    stripped_csv_name = ""
-                    for ch in player_name:
-                        if ch.isalpha():
-                            stripped_csv_name += ch
-                    ratio = fuzz.ratio(stripped_db_name, stripped_csv_name)
-                    partial_ratio = fuzz.partial_ratio(stripped_db_name,
-                                                       stripped_csv_name)
-                    # # Store sudo match
-                    if ratio > 75 and partial_ratio > 85:
-                        meta_player = each_player
-                        if player_name in banned_mappings:
-                            if each_player.name == banned_mappings[player_name]:
-                                continue
-                        try:
-                            # Check if there is already a user player
-                            player = UserPlayer.objects.get(
-                                slate=slate, user=user, meta_player=meta_player)
-                            player.projection = player_projection
-                            assumed_players[player_name] = meta_player.name
-                            player_found = True
-                            player.save()
-                            break
-                        except:
-                            player = UserPlayer.objects.create(
-                                slate=slate, user=user, meta_player=meta_player, lock=False, remove=False, ownership=0, exposure=100, projection=player_projection)
-                            assumed_players[player_name] = meta_player.name
-                            player_found = True
-                            player.save()
-                            break
-                if player_found == False:
-                    unfound_players.append(player_name)
-
+            rows = ((name, float(projection)) for name, projection in projections.items())
+        slate = Slate.objects.get(id=int(request.data['slate']))
+        assumed_players, unfound_players = apply_projections(
+            'NBA', slate, request.user, rows, player_mappings, banned_mappings)
         return Response({'message': 'Success', "assumed-players": assumed_players, 'unfound-players': unfound_players}, status=status.HTTP_200_OK)
     except Exception as e:
         error_message = f"An error occurred: {str(e)}"
@@ -227,11 +93,7 @@ def add_slate(request):
             default_projections = request.FILES['file-two']
             slate = Slate.objects.get(pk=int(request.data['slate']))
             update_default_projections(slate.id, default_projections)
-            for player in Player.objects.filter(slate=slate):
-                new_num = randomize_within_percentage(
-                    float(player.projection), 7.5)
-                player.projection = new_num
-                player.save()
+            jitter_projections('NBA', slate)
             return Response({})
         try:
             slate_file = request.FILES['file-one']
@@ -241,103 +103,11 @@ def add_slate(request):
             default_projections = request.FILES['file-two']
         except:
             default_projections = None
-        csv = DictReader(iterdecode(slate_file, 'utf-8'))
-        # Gather slates game info
-        game_times = []
-        teams = []
-        games = []
-        for row in csv:
-            # Populate game times, teams, and games
-            game_info = row['Game Info']
-            if game_info == '-' or '@' not in game_info:
-                # Pass players with no games
-                continue
-            if game_info not in games:
-                games.append(game_info)  # Add game
-            game_teams, game_time = game_info.split(" ", 1)
-            away_team, home_team = game_teams.split('@')
-            # Add teams
-            if ({'team': away_team, 'opponent': home_team}) not in teams:
-                teams.append({'team': away_team, 'opponent': home_team})
-            if ({'team': home_team, 'opponent': away_team}) not in teams:
-                teams.append({'team': home_team, 'opponent': away_team})
-            # Add game times
-            if game_time not in game_times:
-                game_times.append(game_time)
-        game_count = int(len(teams) / 2)  # Game Count
-        # Store slate time
-        earliest_game = sorted(game_times)[0]
-        earliest_game = earliest_game[:-3]  # Strip time zone
-        earliest_game = datetime.strptime(earliest_game, '%m/%d/%Y %I:%M%p')
-        EDT = ZoneInfo('America/New_York')  # Avoid naive datetime
-        earliest_game = earliest_game.replace(tzinfo=EDT)
-        # Create slate
-        slate = Slate(date=earliest_game, game_count=game_count, sport='NBA')
-        slate.save()
-        # Create teams for the slate
-        for team in teams:
-            # Add teams
-            this_team = Team.objects.create(
-                abbrev=team['team'], opponent=team['opponent'], slate=slate)
-            this_team.save()
-        for game in games:
-            # Add games
-            teams, time = game.split(' ', 1)
-            # Add home and away teams
-            away_team, home_team = teams.split('@')
-            home_team = Team.objects.get(abbrev=home_team, slate=slate)
-            away_team = Team.objects.get(abbrev=away_team, slate=slate)
-            # Add game time
-            time = time[:-3]
-            time = datetime.strptime(time, '%m/%d/%Y %I:%M%p')
-            time = earliest_game.replace(tzinfo=EDT)  # Avoid naive datetime
-            this_game = Game.objects.create(time=time, home_team=home_team,
-                                            away_team=away_team, slate=slate)
-            this_game.save()
-        # Save players and positions
-        csv = DictReader(iterdecode(slate_file, 'utf-8'))
-        for row in csv:
-            game_info = row['Game Info']
-            if game_info == '-' or '@' not in game_info:
-                # Pass players with no games
-                continue
-            players_positions = row['Roster Position'].split('/')
-            default_position = row['Position']
-            position_flags = {'F': False, 'C': False, 'G': False, 'SG': False,
-                              'PG': False, 'SF': False, 'PF': False, 'UTIL': False}
-            for position in players_positions:
-                if position in position_flags:
-                    position_flags[position] = True
-            team = Team.objects.get(abbrev=row['TeamAbbrev'], slate=slate)
-            opponent = team.opponent
-            projection = 0
-
-            # Add player
-            player = Player(name=row['Name'],
-                            projection=projection,
-                            team=team,
-                            opponent=opponent,
-                            dk_id=row['ID'],
-                            salary=row['Salary'],
-                            slate=slate,
-                            F=position_flags['F'],
-                            C=position_flags['C'],
-                            G=position_flags['G'],
-                            SG=position_flags['SG'],
-                            PG=position_flags['PG'],
-                            SF=position_flags['SF'],
-                            PF=position_flags['PF'],
-                            UTIL=position_flags['UTIL'],
-                            position=default_position)
-            player.save()
+        slate = create_slate('NBA', parse_dk_csv(slate_file))
         # Add default projections
         if default_projections:
             update_default_projections(slate.id, default_projections)
-            for player in Player.objects.filter(slate=slate):
-                new_num = randomize_within_percentage(
-                    float(player.projection), 7.5)
-                player.projection = new_num
-                player.save()
+            jitter_projections('NBA', slate)
 
         return Response({})
     except Exception as e:
@@ -442,6 +212,7 @@ def player_settings(request):
                 'projection': projection
             }
         )
+        invalidate_slate('NBA', slate.id)
         return Response({"message": "Player settings updated successfully"}, status=status.HTTP_200_OK)
     except Exception as e:
         error_message = f"An error occurred: {str(e)}"
@@ -494,7 +265,6 @@ def authenticated_optimize(request):
         lineups = request.data['lineups']
         slate = request.data['slate']
         slate = Slate.objects.get(pk=int(slate))
-        user = request.user
         exposures = request.data['exposures']
         optimization_object = Optimization.objects.create(
             lineups=lineups, exposures=exposures, user=request.user, slate=slate)
@@ -508,6 +278,182 @@ def authenticated_optimize(request):
         return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+def optimize(request):
+    try:
+        slate = Slate.objects.get(pk=int(request.data['slate']))
+        num_lineups = int(request.data.get('num-lineups', 20))
+        if num_lineups < 1 or num_lineups > MAX_LINEUPS:
+            return Response({"error": f"Lineup count must be between 1 and {MAX_LINEUPS}"}, status=status.HTTP_400_BAD_REQUEST)
+        parallel = str(request.data.get('parallel', '')).lower() == 'true'
+        backend = request.data.get('solver', 'cbc')
+        stacks = parse_stacks('NBA', request.data)
+        if num_lineups > MAX_SYNC_LINEUPS:
+            return Response({"error": f"Builds of more than {MAX_SYNC_LINEUPS} lineups are too slow to run here; submit them as a job"}, status=status.HTTP_400_BAD_REQUEST)
+        if int(request.data.get('portfolio-size', 0) or 0):
+            return Response({"error": "Portfolio builds are too slow to run here; submit them as a job"}, status=status.HTTP_400_BAD_REQUEST)
+        lineups, exposures, stats = optimize_slate(
+            'NBA', slate, request.user, num_lineups, parallel, backend, stacks=stacks)
+        optimization_object = Optimization.objects.create(
+            lineups=lineups, exposures=exposures, user=request.user, slate=slate)
+        return Response({'id': optimization_object.id, 'lineups': lineups, 'exposures': exposures, 'timings': stats})
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+def late_swap(request):
+    try:
+        optimization = Optimization.objects.get(
+            pk=int(request.data['optimization']), user=request.user)
+        backend = request.data.get('solver', 'cbc')
+        optimization, stats = late_swap_optimization('NBA', optimization, backend)
+        return Response({'id': optimization.id, 'lineups': optimization.lineups, 'exposures': optimization.exposures, 'timings': stats})
+    except Optimization.DoesNotExist:
+        return Response({"error": "Optimization not found"}, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+def simulate_contest(request):
+    try:
+        optimization = Optimization.objects.get(
+            pk=int(request.data['optimization']), user=request.user)
+        field_size = int(request.data.get('field-size', 10000))
+        if field_size < 1 or field_size > MAX_FIELD_SIZE:
+            return Response({"error": f"Field size must be between 1 and {MAX_FIELD_SIZE}"}, status=status.HTTP_400_BAD_REQUEST)
+        sims = int(request.data.get('sims', 5000))
+        if sims < 1 or sims > MAX_SIMULATIONS:
+            return Response({"error": f"Simulation count must be between 1 and {MAX_SIMULATIONS}"}, status=status.HTTP_400_BAD_REQUEST)
+        volatility = float(request.data.get('volatility', 0.25))
+        entry_fee = float(request.data.get('entry-fee', 20))
+        return Response(contest_slate('NBA', optimization, field_size, sims, volatility, entry_fee))
+    except Optimization.DoesNotExist:
+        return Response({"error": "Optimization not found"}, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+def simulate(request):
+    try:
+        slate = Slate.objects.get(pk=int(request.data['slate']))
+        sims = int(request.data.get('sims', 10000))
+        volatility = float(request.data.get('volatility', 0.25))
+        if sims < 1 or sims > MAX_SIMULATIONS:
+            return Response({"error": f"Simulation count must be between 1 and {MAX_SIMULATIONS}"}, status=status.HTTP_400_BAD_REQUEST)
+        if sims > MAX_SYNC_SIMULATIONS:
+            return Response({"error": f"More than {MAX_SYNC_SIMULATIONS} simulations are too slow to run here; submit them as a job"}, status=status.HTTP_400_BAD_REQUEST)
+        solves = int(request.data.get('solves', DEFAULT_SOLVES))
+        if solves < 1 or solves > MAX_SOLVES:
+            return Response({"error": f"Solve count must be between 1 and {MAX_SOLVES}"}, status=status.HTTP_400_BAD_REQUEST)
+        if solves > MAX_SYNC_SOLVES:
+            return Response({"error": f"Simulations with more than {MAX_SYNC_SOLVES} solves are too slow to run here; submit them as a job"}, status=status.HTTP_400_BAD_REQUEST)
+        correlated = str(request.data.get('correlated', '')).lower() == 'true'
+        results = simulate_slate(
+            'NBA', slate, request.user, sims, volatility, correlated, solves)
+        return Response(results)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+def submit_job(request):
+    try:
+        slate = Slate.objects.get(pk=int(request.data['slate']))
+        kind = request.data.get('kind', 'optimize')
+        if kind == 'optimize':
+            num_lineups = int(request.data.get('num-lineups', 20))
+            if num_lineups < 1 or num_lineups > MAX_LINEUPS:
+                return Response({"error": f"Lineup count must be between 1 and {MAX_LINEUPS}"}, status=status.HTTP_400_BAD_REQUEST)
+            portfolio_size = int(request.data.get('portfolio-size', 0) or 0)
+            if portfolio_size and not num_lineups < portfolio_size <= MAX_PORTFOLIO_POOL:
+                return Response({"error": f"Portfolio pool must be larger than the lineup count and at most {MAX_PORTFOLIO_POOL}"}, status=status.HTTP_400_BAD_REQUEST)
+            params = {
+                'num-lineups': num_lineups,
+                'portfolio-size': portfolio_size,
+                'parallel': str(request.data.get('parallel', '')).lower() == 'true',
+                'solver': request.data.get('solver', 'cbc'),
+                'stacks': parse_stacks('NBA', request.data),
+            }
+        elif kind == 'simulate':
+            sims = int(request.data.get('sims', 10000))
+            if sims < 1 or sims > MAX_SIMULATIONS:
+                return Response({"error": f"Simulation count must be between 1 and {MAX_SIMULATIONS}"}, status=status.HTTP_400_BAD_REQUEST)
+            solves = int(request.data.get('solves', DEFAULT_SOLVES))
+            if solves < 1 or solves > MAX_SOLVES:
+                return Response({"error": f"Solve count must be between 1 and {MAX_SOLVES}"}, status=status.HTTP_400_BAD_REQUEST)
+            params = {
+                'sims': sims,
+                'solves': solves,
+                'volatility': float(request.data.get('volatility', 0.25)),
+                'correlated': str(request.data.get('correlated', '')).lower() == 'true',
+            }
+        else:
+            return Response({"error": "Invalid job kind"}, status=status.HTTP_400_BAD_REQUEST)
+        job = OptimizationJob.objects.create(
+            user=request.user, slate=slate, kind=kind, params=params)
+        return Response({'id': job.id, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+def job_status(request, job_id):
+    try:
+        job = OptimizationJob.objects.get(pk=job_id, user=request.user)
+        return Response({'id': job.id, 'kind': job.kind, 'status': job.status, 'progress': job.progress, 'error': job.error})
+    except OptimizationJob.DoesNotExist:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+def job_result(request, job_id):
+    try:
+        job = OptimizationJob.objects.get(pk=job_id, user=request.user)
+        if job.status == 'failed':
+            return Response({"error": job.error}, status=status.HTTP_409_CONFLICT)
+        if job.status != 'done':
+            return Response({'id': job.id, 'status': job.status, 'progress': job.progress}, status=status.HTTP_202_ACCEPTED)
+        if job.kind == 'optimize':
+            optimization = job.optimization
+            if optimization is None:
+                return Response({"error": "Optimization was removed"}, status=status.HTTP_410_GONE)
+            return Response({'id': optimization.id, 'lineups': optimization.lineups, 'exposures': optimization.exposures, 'timings': job.result['timings']})
+        return Response(job.result)
+    except OptimizationJob.DoesNotExist:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 def upload_contest_results(request):
     try:
@@ -594,6 +540,12 @@ def upload_contest_results(request):
                 'points': entry['points'],
             })
 
+        # Entries with the exact same players as each lineup
+        duplicates = duplicate_counts(
+            [[p['name'].lower() for p in detail['players']] for detail in lineup_details])
+        for detail, count in zip(lineup_details, duplicates):
+            detail['duplicates'] = int(count)
+
         ContestResults.objects.update_or_create(
             slate=slate,
             defaults={
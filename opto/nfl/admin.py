@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Slate, Team, Player, Game, UserPlayer, UserOptoSettings, Optimization
+from .models import Slate, Team, Player, Game, UserPlayer, UserOptoSettings, Optimization, OptimizationJob, DraftGroup, SlateIngestion
 
 admin.site.register(Slate)
 admin.site.register(Team)
@@ -8,3 +8,6 @@ admin.site.register(Game)
 admin.site.register(UserPlayer)
 admin.site.register(UserOptoSettings)
 admin.site.register(Optimization)
+admin.site.register(OptimizationJob)
+admin.site.register(DraftGroup)
+admin.site.register(SlateIngestion)
@@ -0,0 +1,85 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from opto.dk_csv import parse_dk_csv
+
+SPORTS = ['NFL', 'NBA', 'MLB']
+ROW_COUNTS = [500, 5000, 50000]
+
+# DK listed position -> Roster Position column
+ROSTER_POSITIONS = {
+    'NFL': {'QB': 'QB', 'RB': 'RB/FLEX', 'WR': 'WR/FLEX', 'TE': 'TE/FLEX', 'DST': 'DST'},
+    'NBA': {'PG': 'PG/G/UTIL', 'SG': 'SG/G/UTIL', 'SF': 'SF/F/UTIL',
+            'PF': 'PF/F/UTIL', 'C': 'C/UTIL'},
+    'MLB': {'SP': 'P', 'RP': 'P', 'C': 'C', '1B': '1B', '2B': '2B', '3B': '3B',
+            'SS': 'SS', 'OF': 'OF'},
+}
+HEADER = 'Position,Name + ID,Name,ID,Roster Position,Salary,Game Info,TeamAbbrev,AvgPointsPerGame'
+
+
+def synthetic_csv(sport, rows, rng):
+    """
+    DK salary CSV text with about `rows` players spread over games of
+    20 players a team.
+    """
+    positions = list(ROSTER_POSITIONS[sport].items())
+    lines = [HEADER]
+    player_id = 30000000
+    game = 0
+    while len(lines) <= rows:
+        away, home = f'A{game}', f'H{game}'
+        game_info = f'{away}@{home} 10/{1 + game % 28:02d}/2026 {1 + game % 11:02d}:00PM ET'
+        for team in (away, home):
+            for k in range(20):
+                position, roster = positions[k % len(positions)]
+                player_id += 1
+                name = f'Player {player_id}'
+                lines.append(f'{position},{name} ({player_id}),{name},{player_id},{roster},'
+                             f'{rng.randrange(3000, 10000, 100)},{game_info},{team},'
+                             f'{rng.uniform(0, 40):.2f}')
+        game += 1
+    return '\n'.join(lines[:rows + 1]) + '\n'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the DK salary CSV parser on synthetic NFL, NBA, and MLB CSVs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sports', nargs='+', default=SPORTS, choices=SPORTS)
+        parser.add_argument('--rows', nargs='+', type=int, default=ROW_COUNTS)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        results = []
+        for sport in options['sports']:
+            for rows in options['rows']:
+                csv_text = synthetic_csv(sport, rows, random.Random(options['seed']))
+                times = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    slate_data = parse_dk_csv(csv_text)
+                    slate_data.is_classic(sport)
+                    times.append(time.perf_counter() - started)
+                best = min(times)
+                results.append({
+                    'sport': sport,
+                    'rows': rows,
+                    'bytes': len(csv_text),
+                    'players': len(slate_data),
+                    'games': len(slate_data.games),
+                    'parse_time': round(best, 5),
+                    'rows_per_second': round(rows / best) if best else None,
+                })
+                self.stderr.write(f'{sport} {rows} rows: {best * 1000:.1f}ms')
+
+        report = json.dumps({'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from opto import optimizer
+from opto.optimizer import SOLVER_BACKENDS, generate_lineups, generate_lineups_parallel
+
+SPORTS = ['NFL', 'NBA', 'MLB']
+GAME_COUNTS = [2, 6, 10, 15]
+LINEUP_COUNTS = [1, 20, 150]
+
+# Players per team on a DK main slate by listed position and salary range;
+# a 15-game slate comes to 500+ players in every sport
+TEAM_SHAPES = {
+    'NFL': [
+        ('QB', 3, 4800, 8400),
+        ('RB', 5, 4000, 9200),
+        ('WR', 8, 3000, 9000),
+        ('TE', 4, 2500, 7600),
+        ('DST', 1, 2200, 4000),
+    ],
+    'NBA': [
+        ('PG', 4, 3000, 10800),
+        ('SG', 4, 3000, 9000),
+        ('SF', 3, 3000, 9800),
+        ('PF', 3, 3000, 10200),
+        ('C', 3, 3000, 11200),
+    ],
+    'MLB': [
+        ('P', 4, 4000, 11000),
+        ('C', 2, 2200, 5000),
+        ('FB', 2, 2500, 5800),
+        ('SB', 2, 2400, 5400),
+        ('TB', 2, 2400, 5600),
+        ('SS', 2, 2500, 5600),
+        ('OF', 4, 2200, 6000),
+    ],
+}
+
+# Roster slots each listed position is also eligible for
+EXTRA_SLOTS = {
+    'NFL': {'RB': ['FLEX'], 'WR': ['FLEX'], 'TE': ['FLEX']},
+    'NBA': {'PG': ['G', 'UTIL'], 'SG': ['G', 'UTIL'], 'SF': ['F', 'UTIL'],
+            'PF': ['F', 'UTIL'], 'C': ['UTIL']},
+    'MLB': {},
+}
+
+
+def synthetic_pool(sport, games, rng):
+    """
+    Player pool shaped like a DK salary CSV with `games` games. Salaries
+    step in $100s like DK's and projections track salary with noise.
+    """
+    pool = []
+    for game in range(games):
+        home, away = f'H{game}', f'A{game}'
+        for team, opponent in ((home, away), (away, home)):
+            for position, count, low, high in TEAM_SHAPES[sport]:
+                for _ in range(count):
+                    salary = rng.randrange(low, high + 100, 100)
+                    value = rng.uniform(1.5, 3.0) if sport == 'MLB' else rng.uniform(3.0, 5.5)
+                    pool.append({
+                        'id': len(pool) + 1,
+                        'name': f'{team} {position} {len(pool) + 1}',
+                        'team': team,
+                        'opponent': opponent,
+                        'game': '@'.join(sorted([team, opponent])),
+                        'salary': salary,
+                        'projection': round(salary / 1000 * value, 2),
+                        'positions': [position] + EXTRA_SLOTS[sport].get(position, []),
+                        'lock': False,
+                        'exposure': 100.0,
+                    })
+    return pool
+
+
+def lineup_projection(pool, lineups):
+    return sum(pool[i]['projection'] for lineup in lineups for i, _ in lineup)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the lineup optimizer on synthetic NFL, NBA, and MLB slates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sports', nargs='+', default=SPORTS, choices=SPORTS)
+        parser.add_argument('--games', nargs='+', type=int, default=GAME_COUNTS)
+        parser.add_argument('--lineups', nargs='+', type=int, default=LINEUP_COUNTS)
+        parser.add_argument('--backend', default='cbc', choices=list(SOLVER_BACKENDS))
+        parser.add_argument('--parallel', action='store_true',
+                            help='Use the process pool lineup generator')
+        parser.add_argument('--workers', nargs='+', type=int, default=[None],
+                            help='Process counts for --parallel, e.g. 1 2 4 8 for a scaling run')
+        parser.add_argument('--no-memory', action='store_true',
+                            help='Skip the separate peak-memory pass')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON results to this file')
+
+    def run(self, generate, pool, sport, settings, num_lineups, backend, memory, **kwargs):
+        """
+        Time one build, then repeat it under tracemalloc for peak memory.
+        Tracing slows PuLP's pure-Python model building a lot, so the
+        timed pass runs without it.
+        """
+        def build():
+            # Time the model build on every run
+            optimizer._model_cache.clear()
+            try:
+                lineups, stats = generate(pool, sport, settings, num_lineups,
+                                          backend=backend, **kwargs)
+                return lineups, stats, None
+            except ValueError as e:
+                return [], {'build_time': 0.0, 'solve_times': []}, str(e)
+
+        started = time.perf_counter()
+        lineups, stats, error = build()
+        wall_time = time.perf_counter() - started
+        peak = None
+        if memory:
+            tracemalloc.start()
+            try:
+                build()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        return lineups, stats, error, wall_time, peak
+
+    def handle(self, *args, **options):
+        settings = {
+            'uniques': 3,
+            'min_salary': 49000,
+            'max_salary': 50000,
+            'max_players_per_team': 5,
+        }
+        backend = options['backend']
+        memory = not options['no_memory']
+        results = []
+        for sport in options['sports']:
+            for games in options['games']:
+                pool = synthetic_pool(sport, games, random.Random(options['seed']))
+                for num_lineups in options['lineups']:
+                    sequential = self.run(generate_lineups, pool, sport, settings,
+                                          num_lineups, backend, memory)
+                    runs = [(None, sequential)]
+                    if options['parallel']:
+                        runs = [(workers, self.run(generate_lineups_parallel, pool, sport,
+                                                   settings, num_lineups, backend, memory,
+                                                   workers=workers))
+                                for workers in options['workers']]
+                    for workers, (lineups, stats, error, wall_time, peak) in runs:
+                        result = {
+                            'sport': sport,
+                            'games': games,
+                            'players': len(pool),
+                            'lineups_requested': num_lineups,
+                            'lineups': len(lineups),
+                            'backend': backend,
+                            'parallel': options['parallel'],
+                            'wall_time': round(wall_time, 4),
+                            'build_time': stats['build_time'],
+                            'solve_time': round(sum(stats['solve_times']), 4),
+                            'peak_memory_mb': round(peak / 2 ** 20, 2) if memory else None,
+                            'projection': round(lineup_projection(pool, lineups), 2),
+                            'error': error,
+                        }
+                        if options['parallel']:
+                            # Speed and lineup quality against the sequential build
+                            result['workers'] = stats.get('workers', workers)
+                            result['speedup'] = round(sequential[3] / wall_time, 2)
+                            result['projection_gap'] = round(
+                                lineup_projection(pool, sequential[0])
+                                - lineup_projection(pool, lineups), 2)
+                        results.append(result)
+                        self.stderr.write(
+                            f"{sport} {games} games ({len(pool)} players), "
+                            f"{num_lineups} lineups: {result['wall_time']}s"
+                            + (f" on {result['workers']} workers" if options['parallel'] else ''))
+
+        report = json.dumps({'settings': settings, 'cpu_count': os.cpu_count(),
+                             'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,125 @@
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from csv import DictReader
+
+import openpyxl
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from nfl.management.commands.bench_dk_csv import synthetic_csv
+from opto.dk_csv import parse_dk_csv
+from opto.rosters import sport_model
+from opto.slate_ingest import create_slate
+from opto.uploads import apply_projections, iter_upload_rows, projection_rows
+from users.models import CustomUser
+
+ROW_COUNTS = [1000, 10000, 100000]
+FORMATS = ['csv', 'xlsx']
+
+
+def write_projections(path, fmt, names, rows, rng):
+    """
+    Projection file of `rows` rows cycling through the slate's player
+    names.
+    """
+    if fmt == 'xlsx':
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['Player', 'Projection'])
+        for i in range(rows):
+            sheet.append([names[i % len(names)], round(rng.uniform(0, 50), 2)])
+        workbook.save(path)
+    else:
+        with open(path, 'w') as f:
+            f.write('Player,Projection\n')
+            for i in range(rows):
+                f.write(f'{names[i % len(names)]},{rng.uniform(0, 50):.2f}\n')
+
+
+def legacy_read(upload, fmt):
+    """
+    The old upload_projections read: the whole file as one string, split
+    into lines.
+    """
+    if fmt == 'xlsx':
+        sheet = openpyxl.load_workbook(upload).active
+        csv_text = "\n".join([",".join(map(str, row))
+                              for row in sheet.iter_rows(values_only=True)])
+    else:
+        csv_text = upload.read().decode('utf-8-sig')
+    return sum(1 for _ in DictReader(csv_text.splitlines()))
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        return tracemalloc.get_traced_memory()[1], elapsed
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory of projection uploads against a throwaway slate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sport', default='NBA', choices=['NFL', 'NBA', 'MLB'])
+        parser.add_argument('--rows', nargs='+', type=int, default=ROW_COUNTS)
+        parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        sport = options['sport']
+        rng = random.Random(options['seed'])
+        results = []
+        # DEBUG keeps every query in memory, which would hide the bound.
+        # Everything written here is rolled back.
+        with override_settings(DEBUG=False), transaction.atomic():
+            slate = create_slate(sport, parse_dk_csv(synthetic_csv(sport, 300, rng)))
+            user = CustomUser.objects.create(username=f'bench-uploads-{time.time_ns()}')
+            names = list(sport_model(sport, 'Player').objects
+                         .filter(slate=slate).values_list('name', flat=True))
+            for fmt in options['formats']:
+                for rows in options['rows']:
+                    with tempfile.NamedTemporaryFile(suffix=f'.{fmt}') as tmp:
+                        write_projections(tmp.name, fmt, names, rows, rng)
+                        with open(tmp.name, 'rb') as f:
+                            upload = File(f, name=tmp.name)
+                            legacy_peak, legacy_time = peak_memory(
+                                lambda: legacy_read(upload, fmt))
+                            f.seek(0)
+                            stream_peak, stream_time = peak_memory(
+                                lambda: sum(1 for _ in projection_rows(iter_upload_rows(upload))))
+                            f.seek(0)
+                            apply_peak, apply_time = peak_memory(lambda: apply_projections(
+                                sport, slate, user, projection_rows(iter_upload_rows(upload)),
+                                {}, {}))
+                    results.append({
+                        'format': fmt,
+                        'rows': rows,
+                        'legacy_read_peak_kb': round(legacy_peak / 1024),
+                        'stream_read_peak_kb': round(stream_peak / 1024),
+                        'apply_peak_kb': round(apply_peak / 1024),
+                        'legacy_read_time': round(legacy_time, 3),
+                        'stream_read_time': round(stream_time, 3),
+                        'apply_time': round(apply_time, 3),
+                    })
+                    self.stderr.write(
+                        f'{fmt} {rows} rows: read peak {legacy_peak / 1024:.0f}KB -> '
+                        f'{stream_peak / 1024:.0f}KB, apply peak {apply_peak / 1024:.0f}KB')
+            transaction.set_rollback(True)
+
+        report = json.dumps({'sport': sport, 'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
@@ -1,14 +1,24 @@
+import hashlib
 import logging
-from csv import DictReader
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 
 import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 
-try:
-    from zoneinfo import ZoneInfo
-except ImportError:
-    from backports.zoneinfo import ZoneInfo
+from opto.dk_csv import parse_dk_csv
+from opto.ingest_metrics import IngestMetrics
+from opto.locks import sport_lock
+from opto.rosters import sport_model
+from opto.slate_ingest import create_slate, existing_slate, mapped_slate, record_draft_group, refresh_slate
 
 logger = logging.getLogger(__name__)
 
@@ -19,20 +29,38 @@ HEADERS = {
 }
 
 SPORTS = ['NFL', 'NBA', 'MLB']
+DOWNLOAD_WORKERS = 8
+REQUEST_TIMEOUT = 30
+# Columns of the end-of-run summary
+PHASES = ['lobby', 'download', 'parse', 'classic', 'write']
 
-# CPT (Captain) is the unique showdown position indicator
-SHOWDOWN_POSITIONS = {'CPT'}
 
-# Positions expected per sport in a Classic contest
-CLASSIC_POSITIONS = {
-    'NFL': {'QB', 'RB', 'WR', 'TE', 'DST', 'FLEX'},
-    'NBA': {'PG', 'SG', 'SF', 'PF', 'C', 'G', 'F', 'UTIL'},
-    'MLB': {'P', 'C', '1B', '2B', '3B', 'SS', 'OF'},
-}
+def make_session(pool_size=DOWNLOAD_WORKERS):
+    """
+    Shared DK session: keeps TLS connections alive across requests, with
+    a pool big enough for every download thread.
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 
 class Command(BaseCommand):
     help = 'Fetch DraftKings Classic slates for NFL, NBA, and MLB'
+    workers = DOWNLOAD_WORKERS
+    session = None
+    refresh = False
+    concurrent = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Per-thread output buffer while sports run concurrently
+        self.local = threading.local()
+        self.sqlite_lock = threading.Lock()
+        self.metrics = IngestMetrics()
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -41,34 +69,115 @@ class Command(BaseCommand):
             default=None,
             help='Only fetch for a specific sport (default: all)',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DOWNLOAD_WORKERS,
+            help='Draft group CSVs to download at once',
+        )
+        parser.add_argument(
+            '--refresh',
+            action='store_true',
+            help='Apply player changes to the slates these draft groups created instead of skipping them',
+        )
+        parser.add_argument(
+            '--concurrent',
+            action='store_true',
+            help='Process the sports in parallel, each on its own DB connection',
+        )
+        parser.add_argument(
+            '--metrics-file',
+            default=settings.INGEST_METRICS_FILE,
+            help='Write run metrics here for the Prometheus node_exporter textfile collector',
+        )
 
     def handle(self, *args, **options):
         sports = [options['sport']] if options['sport'] else SPORTS
-        for sport in sports:
-            self.stdout.write(f'\n--- {sport} ---')
+        self.workers = max(1, options['workers'])
+        self.refresh = options['refresh']
+        self.concurrent = options['concurrent'] and len(sports) > 1
+        # Every download thread of every sport shares the session's pool
+        self.session = make_session(self.workers * (len(sports) if self.concurrent else 1))
+        self.metrics = IngestMetrics()
+        if self.concurrent:
+            with ThreadPoolExecutor(max_workers=len(sports)) as pool:
+                results = list(pool.map(self.run_sport_buffered, sports))
+            # Print each sport's output as one block, in the usual order
+            for lines in results:
+                for error, message in lines:
+                    (self.stderr if error else self.stdout).write(message)
+        else:
+            for sport in sports:
+                self.run_sport(sport)
+        self.write_summary(sports)
+        self.metrics.log_run(sports)
+        if options['metrics_file']:
+            try:
+                self.metrics.write_textfile(options['metrics_file'], sports)
+            except OSError as e:
+                self.stderr.write(f'Could not write metrics to {options["metrics_file"]}: {e}')
+                logger.exception('Could not write ingest metrics')
+
+    def log(self, message, error=False):
+        lines = getattr(self.local, 'lines', None)
+        if lines is not None:
+            lines.append((error, message))
+        else:
+            (self.stderr if error else self.stdout).write(message)
+
+    def run_sport(self, sport):
+        self.log(f'\n--- {sport} ---')
+        with self.metrics.phase(sport, 'total'):
             try:
                 self.process_sport(sport)
             except Exception as e:
-                self.stderr.write(f'  ERROR: {e}')
+                self.metrics.count(sport, 'failed')
+                self.log(f'  ERROR: {e}', error=True)
                 logger.exception('fetch_dk_slates failed for %s', sport)
 
+    def run_sport_buffered(self, sport):
+        self.local.lines = []
+        try:
+            self.run_sport(sport)
+        finally:
+            # Django opened connections for this thread; don't leak them
+            connections.close_all()
+        return self.local.lines
+
+    def write_summary(self, sports):
+        """
+        Seconds per phase for each sport. Download and parse are summed
+        over the download threads, so they can exceed the sport's total.
+        """
+        columns = PHASES + ['total']
+        self.stdout.write('\n' + f"{'sport':<6}" + ''.join(f'{c:>10}' for c in columns))
+        for sport in sports:
+            self.stdout.write(f'{sport:<6}' + ''.join(
+                f'{self.metrics.seconds(sport, c):>10.2f}' for c in columns))
+
     # ------------------------------------------------------------------
     # DraftKings API helpers
     # ------------------------------------------------------------------
 
+    def get(self, url, params):
+        """
+        GET through the shared session, logging how long DK took.
+        """
+        if self.session is None:
+            self.session = make_session(self.workers)
+        started = time.perf_counter()
+        resp = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+        logger.info('GET %s %s -> %s in %.3fs', url, params, resp.status_code,
+                    time.perf_counter() - started)
+        resp.raise_for_status()
+        return resp
+
     def get_classic_draft_group_ids(self, sport):
         """
         Return all Classic draft group IDs for the given sport.
         Duplicates within the same run are excluded by draft group ID.
         """
-        resp = requests.get(
-            DK_LOBBY_URL,
-            params={'sport': sport},
-            headers=HEADERS,
-            timeout=30,
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        data = self.get(DK_LOBBY_URL, {'sport': sport}).json()
 
         classic_type_ids = {
             gt['GameTypeId']
@@ -91,213 +200,156 @@ class Command(BaseCommand):
         return classic_ids
 
     def download_csv(self, draft_group_id):
-        resp = requests.get(
-            DK_CSV_URL,
-            params={'draftGroupId': draft_group_id},
-            headers=HEADERS,
-            timeout=30,
-        )
-        resp.raise_for_status()
-        return resp.text
-
-    # ------------------------------------------------------------------
-    # CSV parsing helpers
-    # ------------------------------------------------------------------
+        return self.get(DK_CSV_URL, {'draftGroupId': draft_group_id}).text
 
-    def is_classic_csv(self, csv_text, sport):
-        """
-        Confirm the CSV is a Classic slate (not Showdown) by checking
-        the Roster Position column contains expected Classic positions.
+    def fetch_draft_group(self, sport, draft_group_id, known_hash=None):
         """
-        reader = DictReader(csv_text.splitlines())
-        positions_seen = set()
-        for row in reader:
-            for pos in row.get('Roster Position', '').split('/'):
-                positions_seen.add(pos.strip())
-        if positions_seen & SHOWDOWN_POSITIONS:
-            return False
-        if not (positions_seen & CLASSIC_POSITIONS.get(sport, set())):
-            return False
-        return True
-
-    def parse_game_metadata(self, csv_text):
+        Download one draft group and parse it unless its CSV hashes the
+        same as last time (slate_data is then None). Runs on a download
+        thread, so it must not touch the database. Also returns the
+        download time.
         """
-        Parse game times and teams from the CSV.
-        Returns (game_times, teams, games) or raises ValueError if nothing valid.
-        """
-        reader = DictReader(csv_text.splitlines())
-        game_times = []
-        teams = []
-        games = []
-        for row in reader:
-            game_info = row.get('Game Info', '')
-            if not game_info or game_info == '-' or '@' not in game_info:
-                continue
-            if game_info not in games:
-                games.append(game_info)
-            game_teams, game_time = game_info.split(' ', 1)
-            away_team, home_team = game_teams.split('@')
-            if {'team': away_team, 'opponent': home_team} not in teams:
-                teams.append({'team': away_team, 'opponent': home_team})
-            if {'team': home_team, 'opponent': away_team} not in teams:
-                teams.append({'team': home_team, 'opponent': away_team})
-            if game_time not in game_times:
-                game_times.append(game_time)
-        if not game_times:
-            raise ValueError('No valid game info found in CSV')
-        return game_times, teams, games
-
-    def parse_earliest_game_dt(self, game_times):
-        EDT = ZoneInfo('America/New_York')
-        earliest_raw = sorted(game_times)[0][:-3]  # strip timezone suffix
-        return datetime.strptime(earliest_raw, '%m/%d/%Y %I:%M%p').replace(tzinfo=EDT)
-
-    # ------------------------------------------------------------------
-    # Duplicate detection
-    # ------------------------------------------------------------------
-
-    def slate_exists(self, sport, earliest_game_dt):
-        if sport == 'NFL':
-            from nfl.models import Slate
-        elif sport == 'NBA':
-            from nba.models import Slate
-        else:
-            from mlb.models import Slate
-        return Slate.objects.filter(sport=sport, date=earliest_game_dt).exists()
+        started = time.perf_counter()
+        with self.metrics.phase(sport, 'download', draft_group=draft_group_id) as record:
+            text = self.download_csv(draft_group_id)
+            record['rows'] = text.count('\n')
+        fetch_time = time.perf_counter() - started
+        csv_hash = hashlib.sha256(text.encode()).hexdigest()
+        if csv_hash == known_hash:
+            return None, csv_hash, fetch_time
+        with self.metrics.phase(sport, 'parse', draft_group=draft_group_id) as record:
+            slate_data = parse_dk_csv(text)
+            record['rows'] = len(slate_data)
+        return slate_data, csv_hash, fetch_time
 
     # ------------------------------------------------------------------
-    # Slate creation
+    # Draft group tracking
     # ------------------------------------------------------------------
 
-    def create_slate(self, sport, csv_text, game_times, teams, games):
-        if sport == 'NFL':
-            from nfl.models import Slate, Team, Player, Game
-        elif sport == 'NBA':
-            from nba.models import Slate, Team, Player, Game
-        else:
-            from mlb.models import Slate, Team, Player, Game
-
-        EDT = ZoneInfo('America/New_York')
-        game_count = len(teams) // 2
-        earliest_game = self.parse_earliest_game_dt(game_times)
-
-        slate = Slate.objects.create(
-            date=earliest_game,
-            game_count=game_count,
-            sport=sport,
-        )
-
-        for team in teams:
-            Team.objects.create(abbrev=team['team'], opponent=team['opponent'], slate=slate)
-
-        for game_info in games:
-            game_teams, time_str = game_info.split(' ', 1)
-            away_abbrev, home_abbrev = game_teams.split('@')
-            home_team_obj = Team.objects.get(abbrev=home_abbrev, slate=slate)
-            away_team_obj = Team.objects.get(abbrev=away_abbrev, slate=slate)
-            game_time = datetime.strptime(time_str[:-3], '%m/%d/%Y %I:%M%p').replace(tzinfo=EDT)
-            Game.objects.create(
-                time=game_time,
-                home_team=home_team_obj,
-                away_team=away_team_obj,
-                slate=slate,
-            )
-
-        reader = DictReader(csv_text.splitlines())
-        for row in reader:
-            game_info = row.get('Game Info', '')
-            if not game_info or game_info == '-' or '@' not in game_info:
-                continue
-            team_abbrev = row.get('TeamAbbrev', '')
-            if team_abbrev == 'FA':
-                continue
-            try:
-                team_obj = Team.objects.get(abbrev=team_abbrev, slate=slate)
-            except Team.DoesNotExist:
-                logger.warning('Team not found: %s', team_abbrev)
-                continue
-
-            roster_positions = row.get('Roster Position', '').split('/')
-            default_position = row.get('Position', '')
-            player_kwargs = dict(
-                name=row['Name'],
-                projection=0,
-                team=team_obj,
-                opponent=team_obj.opponent,
-                dk_id=row['ID'],
-                salary=row['Salary'],
-                slate=slate,
-                position=default_position,
-            )
-
-            if sport == 'NFL':
-                flags = {p: False for p in ['QB', 'RB', 'WR', 'TE', 'DST', 'FLEX']}
-                for pos in roster_positions:
-                    if pos in flags:
-                        flags[pos] = True
-                player_kwargs.update(flags)
-            elif sport == 'NBA':
-                flags = {p: False for p in ['F', 'C', 'G', 'SG', 'PG', 'SF', 'PF', 'UTIL']}
-                for pos in roster_positions:
-                    if pos in flags:
-                        flags[pos] = True
-                player_kwargs.update(flags)
-            elif sport == 'MLB':
-                flags = {p: False for p in ['P', 'C', '1B', '2B', '3B', 'SS', 'OF']}
-                for pos in roster_positions:
-                    if pos in flags:
-                        flags[pos] = True
-                # MLB model uses FB/SB/TB instead of 1B/2B/3B
-                player_kwargs.update({
-                    'P': flags['P'],
-                    'C': flags['C'],
-                    'FB': flags['1B'],
-                    'SB': flags['2B'],
-                    'TB': flags['3B'],
-                    'SS': flags['SS'],
-                    'OF': flags['OF'],
-                })
-
-            Player.objects.create(**player_kwargs)
-
-        return slate
+    def known_hashes(self, sport, draft_group_ids):
+        """
+        Last CSV hash of each draft group that still has its slate, or
+        was not a Classic slate. A Classic draft group whose slate was
+        deleted (the FK is SET_NULL) has to be ingested again, and one
+        skipped for another draft group's slate has no row at all.
+        """
+        DraftGroup = sport_model(sport, 'DraftGroup')
+        return dict(DraftGroup.objects
+                    .filter(dk_id__in=draft_group_ids)
+                    .filter(Q(slate__isnull=False) | Q(classic=False))
+                    .values_list('dk_id', 'csv_hash'))
 
     # ------------------------------------------------------------------
     # Main per-sport flow
     # ------------------------------------------------------------------
 
     def process_sport(self, sport):
-        draft_group_ids = self.get_classic_draft_group_ids(sport)
+        with self.metrics.phase(sport, 'lobby') as record:
+            draft_group_ids = self.get_classic_draft_group_ids(sport)
+            record['rows'] = len(draft_group_ids)
         if not draft_group_ids:
-            self.stdout.write(f'  No Classic contests found')
+            self.log('  No Classic contests found')
             return
 
-        self.stdout.write(f'  Found {len(draft_group_ids)} Classic draft group(s): {draft_group_ids}')
+        self.log(f'  Found {len(draft_group_ids)} Classic draft group(s): {draft_group_ids}')
+
+        known = self.known_hashes(sport, draft_group_ids)
+
+        # Downloads run concurrently; slates are written one at a time on
+        # this thread, in lobby order
+        workers = min(self.workers, len(draft_group_ids))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(dg_id, pool.submit(self.fetch_draft_group, sport, dg_id, known.get(dg_id)))
+                       for dg_id in draft_group_ids]
+            for dg_id, future in futures:
+                try:
+                    slate_data, csv_hash, fetch_time = future.result()
+                    if slate_data is None:
+                        self.metrics.count(sport, 'unchanged')
+                        self.log(f'  Draft group {dg_id}: unchanged — skipping')
+                        continue
+                    with self.metrics.phase(sport, 'write', db=True, draft_group=dg_id) as record:
+                        record['rows'] = self.save_draft_group(
+                            sport, dg_id, slate_data, csv_hash, fetch_time)
+                except Exception as e:
+                    self.metrics.count(sport, 'failed')
+                    self.log(f'  Draft group {dg_id}: ERROR — {e}', error=True)
+                    logger.exception('Error processing draft group %s for %s', dg_id, sport)
+
+    def write_lock(self):
+        """
+        SQLite allows one writer at a time and fails rather than waits
+        when two transactions both try to write, so concurrent sports take
+        turns writing there. PostgreSQL writes in parallel.
+        """
+        if self.concurrent and connection.vendor == 'sqlite':
+            return self.sqlite_lock
+        return nullcontext()
 
-        for dg_id in draft_group_ids:
-            try:
-                csv_text = self.download_csv(dg_id)
-
-                if not self.is_classic_csv(csv_text, sport):
-                    self.stdout.write(f'  Draft group {dg_id}: not a Classic slate — skipping')
-                    continue
-
-                game_times, teams, games = self.parse_game_metadata(csv_text)
-                earliest_game = self.parse_earliest_game_dt(game_times)
-                game_count = len(teams) // 2
-
-                if self.slate_exists(sport, earliest_game):
-                    self.stdout.write(
-                        f'  Draft group {dg_id}: slate already exists for '
-                        f'{sport} {earliest_game.date()} ({game_count} games) — skipping'
-                    )
-                    continue
-
-                slate = self.create_slate(sport, csv_text, game_times, teams, games)
-                self.stdout.write(
-                    f'  Draft group {dg_id}: created slate #{slate.id} '
-                    f'for {sport} {earliest_game.date()} ({game_count} games)'
-                )
-            except Exception as e:
-                self.stderr.write(f'  Draft group {dg_id}: ERROR — {e}')
-                logger.exception('Error processing draft group %s for %s', dg_id, sport)
+    def save_draft_group(self, sport, dg_id, slate_data, csv_hash, fetch_time):
+        """
+        Store one downloaded draft group. Returns the number of player
+        rows written.
+        """
+        with self.write_lock():
+            return self.store_draft_group(sport, dg_id, slate_data, csv_hash, fetch_time)
+
+    def store_draft_group(self, sport, dg_id, slate_data, csv_hash, fetch_time):
+        with self.metrics.phase(sport, 'classic', draft_group=dg_id) as record:
+            classic = slate_data.is_classic(sport)
+            record['rows'] = len(slate_data)
+        if not classic:
+            record_draft_group(sport, dg_id, csv_hash, classic=False)
+            self.metrics.count(sport, 'not_classic')
+            self.log(f'  Draft group {dg_id}: not a Classic slate — skipping')
+            return 0
+
+        with transaction.atomic(), sport_lock(sport):
+            return self.write_draft_group(sport, dg_id, slate_data, csv_hash, fetch_time)
+
+    def write_draft_group(self, sport, dg_id, slate_data, csv_hash, fetch_time):
+        earliest_game = slate_data.earliest_game
+        game_count = slate_data.game_count
+
+        # The slate this draft group created before, even if its earliest
+        # game has since moved. Only that slate is ever refreshed: another
+        # draft group can start at the same time
+        mapped = mapped_slate(sport, dg_id)
+        if mapped is not None and self.refresh:
+            with self.metrics.phase(sport, 'refresh', db=True, draft_group=dg_id) as record, \
+                    CaptureQueriesContext(connection) as queries:
+                diff = refresh_slate(sport, mapped, slate_data)
+                record['rows'] = diff['added'] + diff['updated'] + diff['removed']
+            record_draft_group(sport, dg_id, csv_hash, mapped)
+            self.metrics.count(sport, 'refreshed')
+            self.log(
+                f'  Draft group {dg_id}: refreshed slate #{mapped.id} — '
+                f"{diff['added']} added, {diff['updated']} updated, "
+                f"{diff['removed']} removed, {diff['teams']} new teams "
+                f'({len(queries)} queries)'
+            )
+            return record['rows']
+
+        # Nothing of this draft group's is written, so its hash and
+        # mapping are left as they were
+        existing = mapped or existing_slate(sport, earliest_game)
+        if existing is not None:
+            self.metrics.count(sport, 'existing')
+            self.log(
+                f'  Draft group {dg_id}: slate already exists for '
+                f'{sport} {earliest_game.date()} ({game_count} games) — skipping'
+            )
+            return 0
+
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            slate = create_slate(sport, slate_data, partial(self.metrics.phase, sport))
+        record_draft_group(sport, dg_id, csv_hash, slate)
+        self.metrics.count(sport, 'created')
+        self.log(
+            f'  Draft group {dg_id}: created slate #{slate.id} '
+            f'for {sport} {earliest_game.date()} ({game_count} games) '
+            f'in {time.perf_counter() - started:.2f}s, {len(queries)} queries '
+            f'(downloaded in {fetch_time:.2f}s)'
+        )
+        return len(slate_data)
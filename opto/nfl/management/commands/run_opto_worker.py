@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from opto.dk_csv import parse_dk_csv
+from opto.rosters import sport_model
+from opto.slate_builds import run_job
+from opto.slate_ingest import ingest_slate
+
+logger = logging.getLogger(__name__)
+
+SPORTS = ['NFL', 'NBA', 'MLB']
+POLL_INTERVAL = 2
+# A job still running this long after it was claimed lost its worker
+STALE_AFTER = 3600
+RECLAIM_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Run queued optimization, simulation and slate ingestion jobs for NFL, NBA, and MLB'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=POLL_INTERVAL,
+            help='Seconds to wait between polls of an empty queue',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=float,
+            default=STALE_AFTER,
+            help='Seconds after which a running job is treated as abandoned',
+        )
+
+    def handle(self, *args, **options):
+        next_reclaim = 0
+        while True:
+            if time.monotonic() >= next_reclaim:
+                self.reclaim_stale(options['stale_after'])
+                next_reclaim = time.monotonic() + RECLAIM_INTERVAL
+            ran = False
+            for sport in SPORTS:
+                job = self.claim_job(sport)
+                if job is not None:
+                    ran = True
+                    self.run_job(sport, job)
+                ingestion = self.claim_ingestion(sport)
+                if ingestion is not None:
+                    ran = True
+                    self.run_ingestion(sport, ingestion)
+            if not ran:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+
+    # ------------------------------------------------------------------
+    # Queue helpers
+    # ------------------------------------------------------------------
+
+    def claim_job(self, sport):
+        return self.claim(sport_model(sport, 'OptimizationJob'))
+
+    def claim_ingestion(self, sport):
+        return self.claim(sport_model(sport, 'SlateIngestion'))
+
+    def claim(self, model):
+        """
+        Claim the oldest queued row. SKIP LOCKED lets several workers
+        poll the same table without handing out a job twice.
+        """
+        with transaction.atomic():
+            job = (model.objects
+                   .select_for_update(skip_locked=True)
+                   .filter(status='queued')
+                   .order_by('created_at')
+                   .first())
+            if job is None:
+                return None
+            job.status = 'running'
+            job.started_at = timezone.now()
+            job.save(update_fields=['status', 'started_at'])
+        return job
+
+    def reclaim_stale(self, stale_after):
+        """
+        Fail jobs and ingestions whose worker died mid-run, so clients
+        polling them stop waiting. They are not re-queued, since the job
+        itself may be what killed the worker.
+        """
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        for sport in SPORTS:
+            for model in (sport_model(sport, 'OptimizationJob'), sport_model(sport, 'SlateIngestion')):
+                count = model.objects.filter(status='running', started_at__lt=cutoff).update(
+                    status='failed', finished_at=timezone.now(),
+                    error='The worker stopped before the job finished; submit it again')
+                if count:
+                    self.stdout.write(f'{sport}: failed {count} stale {model.__name__} row(s)')
+
+    def run_job(self, sport, job):
+        self.stdout.write(f'{sport} job #{job.id} ({job.kind}) started')
+        try:
+            run_job(sport, job)
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.exception('%s job %s failed', sport, job.id)
+        job.finished_at = timezone.now()
+        job.save()
+        self.stdout.write(f'{sport} job #{job.id} {job.status}')
+
+    def run_ingestion(self, sport, ingestion):
+        SlateIngestion = sport_model(sport, 'SlateIngestion')
+        self.stdout.write(f'{sport} ingestion #{ingestion.id} started')
+        try:
+            slate_data = parse_dk_csv(ingestion.csv)
+            SlateIngestion.objects.filter(pk=ingestion.pk).update(progress=50)
+            ingestion.result, ingestion.slate = ingest_slate(
+                sport, slate_data, ingestion.refresh, ingestion.draft_group_dk_id,
+                hashlib.sha256(ingestion.csv.encode()).hexdigest())
+            ingestion.status = 'done'
+            ingestion.progress = 100
+            # The slate rows are the record now
+            ingestion.csv = ''
+        except Exception as e:
+            ingestion.status = 'failed'
+            ingestion.error = str(e)
+            logger.exception('%s ingestion %s failed', sport, ingestion.id)
+        ingestion.finished_at = timezone.now()
+        ingestion.save()
+        self.stdout.write(f'{sport} ingestion #{ingestion.id} {ingestion.status}')
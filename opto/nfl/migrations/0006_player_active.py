@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nfl', '0005_draftgroup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
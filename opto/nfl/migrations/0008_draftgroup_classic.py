@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nfl', '0007_slateingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='draftgroup',
+            name='classic',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nfl', '0008_draftgroup_classic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slateingestion',
+            name='draft_group_dk_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
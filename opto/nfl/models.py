@@ -48,6 +48,8 @@ class Player(models.Model):
     dk_id = models.IntegerField()
     salary = models.IntegerField()
     slate = models.ForeignKey(Slate, on_delete=models.CASCADE)
+    # Cleared when a refresh no longer finds the player in the DK CSV
+    active = models.BooleanField(default=True)
 
     def __str__(self):
         return f"{self.name}"
@@ -112,3 +114,76 @@ class Optimization(models.Model):
 
     def __str__(self):
         return f"Optimization - {self.id}"
+
+
+class OptimizationJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    KIND_CHOICES = [
+        ('optimize', 'Optimize'),
+        ('simulate', 'Simulate'),
+    ]
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='user_nfl_jobs')
+    slate = models.ForeignKey(Slate, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    progress = models.IntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    optimization = models.ForeignKey(
+        Optimization, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job - {self.id} ({self.kind}, {self.status})"
+
+
+class DraftGroup(models.Model):
+    dk_id = models.IntegerField(unique=True)
+    sport = models.CharField(max_length=4, choices=Slate.OPTION_CHOICES)
+    slate = models.ForeignKey(
+        Slate, on_delete=models.SET_NULL, null=True, blank=True)
+    # Non-Classic draft groups are tracked with no slate on purpose
+    classic = models.BooleanField(default=True)
+    csv_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Draft Group - {self.dk_id} ({self.sport})"
+
+
+class SlateIngestion(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    sport = models.CharField(max_length=4, choices=Slate.OPTION_CHOICES)
+    csv = models.TextField(blank=True, default='')
+    refresh = models.BooleanField(default=False)
+    # DK draft group id of the CSV; a refresh needs it to find the slate
+    draft_group_dk_id = models.IntegerField(null=True, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    progress = models.IntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    slate = models.ForeignKey(
+        Slate, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Ingestion - {self.id} ({self.sport}, {self.status})"
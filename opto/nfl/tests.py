@@ -1,3 +1,265 @@
-from django.test import TestCase
+import json
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.files import File
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from nfl.management.commands.bench_dk_csv import synthetic_csv
+from nfl.management.commands.bench_uploads import legacy_read, write_projections
+from nfl.models import DraftGroup, Game, Optimization, Player, Slate, UserPlayer
+from opto.dk_csv import parse_dk_csv
+from opto.optimizer import generate_lineups
+from opto.portfolio import select_portfolio
+from opto.slate_builds import get_opto_settings, get_player_pool, late_swap_optimization, optimize_slate
+from opto.slate_ingest import create_slate
+from opto.uploads import BATCH_SIZE, apply_projections, iter_upload_rows, projection_rows
+from users.models import CustomUser
+
+CLASSIC_GAME_TYPE = 1
+DRAFT_GROUP_IDS = [1000, 1001, 1002, 1003, 1004, 1005]
+# Seconds the stub DK server takes to serve each salary CSV
+CSV_DELAY = 0.3
+
+CSV_HEADER = 'Position,Name + ID,Name,ID,Roster Position,Salary,Game Info,TeamAbbrev,AvgPointsPerGame'
+ROSTER_POSITIONS = [('QB', 'QB'), ('RB', 'RB/FLEX'), ('WR', 'WR/FLEX'),
+                    ('TE', 'TE/FLEX'), ('DST', 'DST')]
+
+
+def salary_csv(draft_group_id, day=None):
+    """
+    Two-game NFL Classic salary CSV whose games start on a different
+    day for each draft group, so each one becomes its own slate.
+    """
+    if day is None:
+        day = draft_group_id - DRAFT_GROUP_IDS[0] + 1
+    lines = [CSV_HEADER]
+    player_id = draft_group_id * 100
+    for game in range(2):
+        away, home = f'A{game}', f'H{game}'
+        game_info = f'{away}@{home} 10/{day:02d}/2026 0{game + 1}:00PM ET'
+        for team in (away, home):
+            for position, roster in ROSTER_POSITIONS:
+                player_id += 1
+                name = f'{team} {position} {player_id}'
+                lines.append(f'{position},{name} ({player_id}),{name},{player_id},'
+                             f'{roster},5000,{game_info},{team},10.0')
+    return '\n'.join(lines) + '\n'
+
+
+class StubDKHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/lobby':
+            body = json.dumps({
+                'GameTypes': [{'GameTypeId': CLASSIC_GAME_TYPE, 'Name': 'Classic'}],
+                'DraftGroups': [{'DraftGroupId': dg_id, 'GameTypeId': CLASSIC_GAME_TYPE}
+                                for dg_id in DRAFT_GROUP_IDS],
+            }).encode()
+            content_type = 'application/json'
+        elif url.path == '/csv':
+            time.sleep(CSV_DELAY)
+            body = salary_csv(int(params['draftGroupId'][0])).encode()
+            content_type = 'text/csv'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchDKSlatesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubDKHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        cls.patches = [
+            mock.patch('nfl.management.commands.fetch_dk_slates.DK_LOBBY_URL', f'{base_url}/lobby'),
+            mock.patch('nfl.management.commands.fetch_dk_slates.DK_CSV_URL', f'{base_url}/csv'),
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for patch in cls.patches:
+            patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def fetch(self, *args):
+        out = StringIO()
+        with self.assertLogs('opto.ingest', level='INFO'):
+            call_command('fetch_dk_slates', '--sport', 'NFL', '--metrics-file', '',
+                         *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_creates_a_slate_per_draft_group(self):
+        output = self.fetch()
+        self.assertEqual(Slate.objects.filter(sport='NFL').count(), len(DRAFT_GROUP_IDS))
+        self.assertEqual(Player.objects.count(), len(DRAFT_GROUP_IDS) * 20)
+        self.assertEqual(
+            set(DraftGroup.objects.filter(slate__isnull=False).values_list('dk_id', flat=True)),
+            set(DRAFT_GROUP_IDS))
+        self.assertEqual(output.count('created slate'), len(DRAFT_GROUP_IDS))
+
+    def test_downloads_run_concurrently(self):
+        started = time.perf_counter()
+        self.fetch('--workers', str(len(DRAFT_GROUP_IDS)))
+        elapsed = time.perf_counter() - started
+        # One at a time the CSVs alone would take len(DRAFT_GROUP_IDS) * CSV_DELAY
+        self.assertLess(elapsed, len(DRAFT_GROUP_IDS) * CSV_DELAY / 2)
+
+    def test_rerun_skips_unchanged_draft_groups(self):
+        self.fetch()
+        output = self.fetch()
+        self.assertEqual(Slate.objects.filter(sport='NFL').count(), len(DRAFT_GROUP_IDS))
+        self.assertEqual(output.count('unchanged — skipping'), len(DRAFT_GROUP_IDS))
+        self.assertNotIn('created slate', output)
+
+    def test_rerun_recreates_deleted_slate(self):
+        self.fetch()
+        DraftGroup.objects.get(dk_id=DRAFT_GROUP_IDS[0]).slate.delete()
+        output = self.fetch()
+        self.assertEqual(Slate.objects.filter(sport='NFL').count(), len(DRAFT_GROUP_IDS))
+        self.assertIsNotNone(DraftGroup.objects.get(dk_id=DRAFT_GROUP_IDS[0]).slate)
+        self.assertIn(f'Draft group {DRAFT_GROUP_IDS[0]}: created slate', output)
+        self.assertEqual(output.count('unchanged — skipping'), len(DRAFT_GROUP_IDS) - 1)
+
+    def test_refresh_leaves_other_draft_groups_slate_alone(self):
+        # Another draft group's slate with the same earliest game
+        other = create_slate('NFL', parse_dk_csv(salary_csv(2000, day=1)))
+        self.fetch('--refresh')
+        self.assertFalse(Player.objects.filter(slate=other, active=False).exists())
+
+    def test_skipped_draft_group_is_not_mapped(self):
+        create_slate('NFL', parse_dk_csv(salary_csv(2000, day=1)))
+        self.fetch()
+        self.assertFalse(DraftGroup.objects.filter(dk_id=DRAFT_GROUP_IDS[0]).exists())
+
+
+def peak_memory(func):
+    """Peak traced memory, in bytes, of calling func."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# DEBUG keeps every query in memory, which would hide the bound
+@override_settings(DEBUG=False)
+class ProjectionUploadMemoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rng = random.Random(0)
+        cls.slate = create_slate('NFL', parse_dk_csv(synthetic_csv('NFL', 300, cls.rng)))
+        cls.user = CustomUser.objects.create(username='upload-memory')
+        cls.names = list(Player.objects.filter(slate=cls.slate).values_list('name', flat=True))
+
+    def upload_peaks(self, fmt, rows):
+        """
+        Peak memory of storing a projection file of `rows` rows, and of
+        the old read of the whole file into one string.
+        """
+        with tempfile.NamedTemporaryFile(suffix=f'.{fmt}') as tmp:
+            write_projections(tmp.name, fmt, self.names, rows, self.rng)
+            with open(tmp.name, 'rb') as f:
+                upload = File(f, name=tmp.name)
+                apply_peak = peak_memory(lambda: apply_projections(
+                    'NFL', self.slate, self.user, projection_rows(iter_upload_rows(upload)),
+                    {}, {}))
+                f.seek(0)
+                legacy_peak = peak_memory(lambda: legacy_read(upload, fmt))
+        self.assertEqual(UserPlayer.objects.filter(slate=self.slate, user=self.user).count(),
+                         len(self.names))
+        return apply_peak, legacy_peak
+
+    def test_csv_upload_memory_does_not_grow_with_rows(self):
+        small, _ = self.upload_peaks('csv', BATCH_SIZE * 2)
+        large, _ = self.upload_peaks('csv', BATCH_SIZE * 40)
+        self.assertLess(large, small * 1.25)
+
+    def test_xlsx_upload_memory_is_below_whole_file_read(self):
+        # openpyxl's read-only reader keeps an emptied element per row,
+        # so XLSX peaks grow slowly with the file
+        apply_peak, legacy_peak = self.upload_peaks('xlsx', BATCH_SIZE * 40)
+        self.assertLess(apply_peak, legacy_peak / 3)
+
+
+class LateSwapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.slate = create_slate('NFL', parse_dk_csv(synthetic_csv('NFL', 160, random.Random(0))))
+        cls.user = CustomUser.objects.create(username='late-swap')
+        # The first game has kicked off, the rest have not
+        cls.now = Game.objects.filter(slate=cls.slate).order_by('time').first().time
+
+    def build(self, num_lineups):
+        lineups, exposures, _ = optimize_slate('NFL', self.slate, self.user, num_lineups)
+        return Optimization.objects.create(lineups=lineups, exposures=exposures,
+                                           user=self.user, slate=self.slate)
+
+    def started_players(self, lineup):
+        started = set(Game.objects.filter(slate=self.slate, time__lte=self.now)
+                      .values_list('home_team__abbrev', 'away_team__abbrev')[0])
+        return [player for player in lineup['players'] if player['team'] in started]
+
+    def test_started_player_out_of_pool_keeps_slot(self):
+        optimization = self.build(3)
+        kept = self.started_players(optimization.lineups[0])[0]
+        Player.objects.filter(pk=kept['id']).update(active=False)
+        optimization, _ = late_swap_optimization('NFL', optimization, now=self.now)
+        slots = {(player['id'], player['position']) for player in optimization.lineups[0]['players']}
+        self.assertIn((kept['id'], kept['position']), slots)
+
+    def test_swapped_lineups_stay_unique(self):
+        optimization = self.build(5)
+        optimization, _ = late_swap_optimization('NFL', optimization, now=self.now)
+        players = [frozenset(player['id'] for player in lineup['players'])
+                   for lineup in optimization.lineups]
+        self.assertEqual(len(set(players)), len(players))
+
+
+class PortfolioExposureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.slate = create_slate('NFL', parse_dk_csv(synthetic_csv('NFL', 160, random.Random(1))))
+        cls.user = CustomUser.objects.create(username='portfolio')
+
+    def setUp(self):
+        self.pool = get_player_pool('NFL', self.slate, self.user)
+        self.settings = get_opto_settings('NFL', self.user)
+        self.candidates, _ = generate_lineups(self.pool, 'NFL', self.settings, 12)
+
+    def test_zero_exposure_player_is_never_selected(self):
+        banned = self.candidates[0][0][0]
+        self.pool[banned]['exposure'] = 0.0
+        lineups, _ = select_portfolio(self.pool, 'NFL', self.settings, self.candidates, 5, sims=256)
+        self.assertTrue(lineups)
+        self.assertFalse(any(i == banned for lineup in lineups for i, _ in lineup))
+
+    def test_short_portfolio_reports_shortfall(self):
+        lineups, stats = select_portfolio(self.pool, 'NFL', self.settings, self.candidates, 20,
+                                          sims=256)
+        self.assertEqual(stats['shortfall'], 20 - len(lineups))
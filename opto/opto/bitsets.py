@@ -0,0 +1,91 @@
+import numpy as np
+
+# Lineups are rows of uint64 words with bit i set when pool index i is in
+# the lineup, so overlap between two lineups is popcount(a & b)
+WORD_BITS = 64
+
+
+def num_words(num_players):
+    return max(1, -(-num_players // WORD_BITS))
+
+
+def pack_lineups(lineups, num_players):
+    """
+    L x W uint64 bitsets for lineups given as iterables of pool indices
+    or (pool index, slot) pairs.
+    """
+    bits = np.zeros((len(lineups), num_words(num_players)), dtype=np.uint64)
+    rows = []
+    players = []
+    for row, lineup in enumerate(lineups):
+        for entry in lineup:
+            rows.append(row)
+            players.append(entry[0] if isinstance(entry, tuple) else entry)
+    if players:
+        players = np.array(players, dtype=np.uint64)
+        np.bitwise_or.at(bits, (np.array(rows), (players // WORD_BITS).astype(np.int64)),
+                         np.uint64(1) << (players % WORD_BITS))
+    return bits
+
+
+def popcount(words):
+    """
+    Set bits along the last axis, using the SWAR bit count on whole
+    uint64 words.
+    """
+    words = np.asarray(words, dtype=np.uint64)
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + \
+        ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    words = (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+    return words.sum(axis=-1, dtype=np.int64)
+
+
+def unpack(bits, num_players):
+    """
+    Dense L x P 0/1 membership matrix.
+    """
+    words = np.ascontiguousarray(bits, dtype='<u8')
+    return np.unpackbits(words.view(np.uint8), axis=1, bitorder='little')[:, :num_players]
+
+
+def is_unique(bits, lineup, max_overlap):
+    """
+    Whether one packed lineup shares at most max_overlap players with
+    every lineup in bits.
+    """
+    if not len(bits):
+        return True
+    return bool(popcount(bits & lineup).max() <= max_overlap)
+
+
+def contains(bits, player):
+    """
+    Boolean mask of the lineups that include a pool index.
+    """
+    word = bits[:, player // WORD_BITS]
+    return (word >> np.uint64(player % WORD_BITS)) & np.uint64(1) == 1
+
+
+def player_counts(bits, num_players):
+    """
+    Number of lineups each pool index appears in.
+    """
+    return unpack(bits, num_players).sum(axis=0, dtype=np.int64)
+
+
+def duplicate_counts(lineups):
+    """
+    For lineups given as lists of hashable player keys, how many of the
+    lineups are the same set of players as each one.
+    """
+    index = {}
+    packed = [[index.setdefault(key, len(index)) for key in lineup]
+              for lineup in lineups]
+    if not packed:
+        return np.zeros(0, dtype=np.int64)
+    bits = pack_lineups(packed, len(index))
+    _, inverse, counts = np.unique(bits, axis=0, return_inverse=True,
+                                   return_counts=True)
+    return counts[inverse.ravel()]
@@ -0,0 +1,180 @@
+import csv
+import io
+from datetime import datetime
+
+import numpy as np
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    from backports.zoneinfo import ZoneInfo
+
+EDT = ZoneInfo('America/New_York')
+
+# CPT (Captain) is the unique showdown position indicator
+SHOWDOWN_POSITIONS = {'CPT'}
+
+# Positions expected per sport in a Classic contest
+CLASSIC_POSITIONS = {
+    'NFL': {'QB', 'RB', 'WR', 'TE', 'DST', 'FLEX'},
+    'NBA': {'PG', 'SG', 'SF', 'PF', 'C', 'G', 'F', 'UTIL'},
+    'MLB': {'P', 'C', '1B', '2B', '3B', 'SS', 'OF'},
+}
+
+# One bit per DK roster position across all sports
+POSITION_BITS = {}
+for _positions in CLASSIC_POSITIONS.values():
+    for _position in sorted(_positions):
+        POSITION_BITS.setdefault(_position, len(POSITION_BITS))
+POSITION_BITS['CPT'] = len(POSITION_BITS)
+
+REQUIRED_COLUMNS = {'Name', 'ID', 'Salary', 'Roster Position', 'Game Info', 'TeamAbbrev'}
+
+# Player model flags that differ from DK's roster position names
+POSITION_FIELDS = {'1B': 'FB', '2B': 'SB', '3B': 'TB'}
+
+
+def parse_game_time(time_str):
+    # DK game times end in a time zone suffix, always Eastern
+    return datetime.strptime(time_str[:-3], '%m/%d/%Y %I:%M%p').replace(tzinfo=EDT)
+
+
+class DKSlate:
+    """
+    Columnar view of a DK salary CSV built in a single pass: per-player
+    arrays of names, ids, salaries, roster position bitmasks and team
+    codes, plus the slate's games and teams.
+    """
+
+    def __init__(self, rows):
+        self.games = {}
+        self.teams = []
+        self.opponents = {}
+        self.roster_positions = set()
+        team_index = {}
+        names = []
+        positions = []
+        ids = []
+        salaries = []
+        masks = []
+        team_codes = []
+
+        header = next(rows, None) or []
+        column = {name.strip(): i for i, name in enumerate(header)}
+        missing = REQUIRED_COLUMNS - column.keys()
+        if missing:
+            raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+        name_col = column['Name']
+        id_col = column['ID']
+        salary_col = column['Salary']
+        roster_col = column['Roster Position']
+        game_col = column['Game Info']
+        team_col = column['TeamAbbrev']
+        position_col = column.get('Position')
+
+        for row in rows:
+            if len(row) <= max(game_col, team_col, roster_col):
+                continue
+            roster = row[roster_col].split('/')
+            self.roster_positions.update(position.strip() for position in roster)
+            game_info = row[game_col]
+            if not game_info or game_info == '-' or '@' not in game_info:
+                # Players with no games
+                continue
+            if game_info not in self.games:
+                game_teams, time_str = game_info.split(' ', 1)
+                away, home = game_teams.split('@')
+                self.games[game_info] = (away, home, time_str)
+                for team, opponent in ((away, home), (home, away)):
+                    if team not in team_index:
+                        team_index[team] = len(self.teams)
+                        self.teams.append(team)
+                        self.opponents[team] = opponent
+            team = row[team_col]
+            if team == 'FA':
+                continue
+            mask = 0
+            for position in roster:
+                bit = POSITION_BITS.get(position.strip())
+                if bit is not None:
+                    mask |= 1 << bit
+            names.append(row[name_col])
+            positions.append(row[position_col] if position_col is not None else '')
+            ids.append(int(row[id_col]))
+            salaries.append(int(row[salary_col]))
+            masks.append(mask)
+            team_codes.append(team_index.get(team, -1))
+
+        self.names = names
+        self.positions = positions
+        self.ids = np.array(ids, dtype=np.int64)
+        self.salaries = np.array(salaries, dtype=np.int64)
+        self.roster_masks = np.array(masks, dtype=np.int64)
+        self.team_codes = np.array(team_codes, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def game_times(self):
+        return sorted({time_str for _, _, time_str in self.games.values()})
+
+    @property
+    def game_count(self):
+        return len(self.teams) // 2
+
+    @property
+    def earliest_game(self):
+        if not self.games:
+            raise ValueError('No valid game info found in CSV')
+        return parse_game_time(self.game_times[0])
+
+    def is_classic(self, sport):
+        """
+        Classic slates (not Showdown) list the expected Classic positions
+        and no Captain slot.
+        """
+        if self.roster_positions & SHOWDOWN_POSITIONS:
+            return False
+        return bool(self.roster_positions & CLASSIC_POSITIONS.get(sport, set()))
+
+    def team(self, i):
+        code = self.team_codes[i]
+        return self.teams[code] if code >= 0 else None
+
+    def position_flags(self, i, sport):
+        """
+        Player model position flags for player i.
+        """
+        mask = int(self.roster_masks[i])
+        return {POSITION_FIELDS.get(position, position): bool(mask >> POSITION_BITS[position] & 1)
+                for position in CLASSIC_POSITIONS[sport]}
+
+
+def check_columns(text):
+    """
+    Cheap up-front check of a DK CSV's header row, without reading the
+    rest of the file.
+    """
+    header = next(csv.reader(io.StringIO(text.lstrip('\ufeff').split('\n', 1)[0])), [])
+    missing = REQUIRED_COLUMNS - {name.strip() for name in header}
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+
+
+def parse_dk_csv(source):
+    """
+    Parse a DK salary CSV from text, bytes or an uploaded file. Files are
+    read a line at a time.
+    """
+    if hasattr(source, 'read'):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        lines = (line.decode('utf-8-sig') if isinstance(line, bytes) else line.lstrip('\ufeff')
+                 for line in source)
+        return DKSlate(csv.reader(lines))
+    if isinstance(source, bytes):
+        source = source.decode('utf-8-sig')
+    elif source.startswith('\ufeff'):
+        source = source[1:]
+    return DKSlate(csv.reader(io.StringIO(source)))
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# One JSON object per line, see LOGGING in settings
+logger = logging.getLogger('opto.ingest')
+
+OUTCOMES = ['created', 'refreshed', 'existing', 'unchanged', 'not_classic', 'failed']
+
+
+@contextmanager
+def untimed(name, db=False):
+    """
+    Stand-in for IngestMetrics.phase when nothing is being measured.
+    """
+    yield {'rows': 0}
+
+
+class IngestMetrics:
+    """
+    Timings, row counts and query counts per sport and ingestion phase
+    for one fetch run. Each phase is logged as a JSON line when it ends,
+    and the run's totals can be written out for Prometheus' textfile
+    collector. Safe to use from the download threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {}
+        self.outcomes = {}
+
+    @contextmanager
+    def phase(self, sport, name, db=False, **fields):
+        """
+        Time the enclosed block. Set record['rows'] inside it to report
+        how many rows it handled. Queries are only counted when db is set,
+        since counting opens a connection on the current thread.
+        """
+        record = {'rows': 0}
+        queries = CaptureQueriesContext(connection) if db else None
+        started = time.perf_counter()
+        ok = False
+        try:
+            if queries is not None:
+                with queries:
+                    yield record
+            else:
+                yield record
+            ok = True
+        finally:
+            seconds = time.perf_counter() - started
+            # The capture has no final count when the block raised
+            query_count = len(queries) if queries is not None and ok else 0
+            self.record(sport, name, seconds, record['rows'], query_count, ok, fields)
+
+    def record(self, sport, name, seconds, rows, queries, ok, fields=None):
+        with self.lock:
+            totals = self.phases.setdefault(
+                (sport, name), {'seconds': 0.0, 'rows': 0, 'queries': 0, 'count': 0, 'errors': 0})
+            totals['seconds'] += seconds
+            totals['rows'] += rows
+            totals['queries'] += queries
+            totals['count'] += 1
+            totals['errors'] += 0 if ok else 1
+        logger.info(json.dumps({
+            'event': 'ingest_phase',
+            'sport': sport,
+            'phase': name,
+            'seconds': round(seconds, 4),
+            'rows': rows,
+            'queries': queries,
+            'ok': ok,
+            **(fields or {}),
+        }))
+
+    def count(self, sport, outcome):
+        with self.lock:
+            counts = self.outcomes.setdefault(sport, dict.fromkeys(OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def seconds(self, sport, name):
+        return self.phases.get((sport, name), {}).get('seconds', 0.0)
+
+    def failed(self, sport):
+        return (self.outcomes.get(sport, {}).get('failed', 0) > 0
+                or any(totals['errors'] for (s, _), totals in self.phases.items() if s == sport))
+
+    def log_run(self, sports):
+        logger.info(json.dumps({
+            'event': 'ingest_run',
+            'seconds': round(time.time() - self.started, 4),
+            'sports': {sport: {'ok': not self.failed(sport),
+                               **self.outcomes.get(sport, dict.fromkeys(OUTCOMES, 0))}
+                       for sport in sports},
+        }))
+
+    def prometheus(self, sports):
+        """
+        The run in Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        phases = sorted(self.phases.items())
+        metric('opto_ingest_phase_seconds', 'gauge',
+               'Seconds spent in each ingestion phase during the last run.',
+               [({'sport': s, 'phase': p}, round(t['seconds'], 6)) for (s, p), t in phases])
+        metric('opto_ingest_phase_rows', 'gauge',
+               'Rows handled by each ingestion phase during the last run.',
+               [({'sport': s, 'phase': p}, t['rows']) for (s, p), t in phases])
+        metric('opto_ingest_phase_queries', 'gauge',
+               'Database queries made by each ingestion phase during the last run.',
+               [({'sport': s, 'phase': p}, t['queries']) for (s, p), t in phases])
+        metric('opto_ingest_phase_errors', 'gauge',
+               'Ingestion phase runs that raised during the last run.',
+               [({'sport': s, 'phase': p}, t['errors']) for (s, p), t in phases])
+        metric('opto_ingest_draft_groups', 'gauge',
+               'Draft groups by outcome during the last run.',
+               [({'sport': sport, 'outcome': outcome}, count)
+                for sport in sports
+                for outcome, count in self.outcomes.get(sport, dict.fromkeys(OUTCOMES, 0)).items()])
+        metric('opto_ingest_success', 'gauge',
+               '1 if the last run ingested the sport without errors.',
+               [({'sport': sport}, 0 if self.failed(sport) else 1) for sport in sports])
+        metric('opto_ingest_last_run_duration_seconds', 'gauge',
+               'Wall time of the last run.', [({}, round(time.time() - self.started, 6))])
+        metric('opto_ingest_last_run_timestamp_seconds', 'gauge',
+               'Unix time the last run finished.', [({}, int(time.time()))])
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path, sports):
+        """
+        Replace the collector file atomically so node_exporter never
+        reads a half-written file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.opto_ingest', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus(sports))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,24 @@
+import zlib
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+def lock_key(name):
+    # pg advisory locks take a signed 64-bit key
+    return zlib.crc32(name.encode())
+
+
+@contextmanager
+def sport_lock(sport, scope='slate-ingest'):
+    """
+    Transaction-scoped advisory lock per sport, so the fetch command and
+    the ingest worker never check for and create the same slate at once.
+    Must be used inside transaction.atomic(). Backends without advisory
+    locks (SQLite in development) already serialize writers, so it is a
+    no-op there.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock_key(f'{scope}:{sport}')])
+    yield
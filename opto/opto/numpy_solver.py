@@ -0,0 +1,257 @@
+import heapq
+import math
+import time
+from collections import OrderedDict
+from functools import reduce
+
+import numpy as np
+
+from .rosters import ROSTER_RULES, roster_size, team_limit
+from .stacking import compile_stacks, stack_conflict
+
+# Bonus added to forced players so the DP must take them
+FORCE_BONUS = 1e4
+MAX_NODES = 5000
+MEMO_SIZE = 20000
+
+
+def removal_branches(players, forced):
+    """
+    Disjoint branches for "at least one of players must go": branch j
+    drops the j-th player and keeps every player before it.
+    """
+    players = [i for i in players if i not in forced]
+    return [(set(players[:j]), {i}) for j, i in enumerate(players)]
+
+
+class NumpyLineupModel:
+    """
+    In-process classic roster solver with the same interface as
+    LineupModel. A position-slot DP over a salary grid finds the best
+    lineup for the slot and salary rules; team limits, the two-game rule,
+    stacking rules and uniqueness cuts are enforced by best-first branch
+    and bound on whichever of those constraints the DP lineup breaks.
+    """
+
+    def __init__(self, pool, sport, settings):
+        started = time.perf_counter()
+        rules = ROSTER_RULES[sport]
+        slots = rules['slots']
+        self.pool = pool
+        self.slot_order = list(slots)
+        self.size = roster_size(sport)
+        self.uniques = min(max(settings['uniques'], 1), self.size)
+        self.max_per_team = team_limit(sport, settings)
+        self.min_games = rules['min_games']
+
+        max_salary = min(settings['max_salary'], rules['salary_cap'])
+        salaries = [player['salary'] for player in pool]
+        self.unit = reduce(math.gcd, salaries, max_salary) or 1
+        self.salary = np.array(salaries, dtype=np.int64) // self.unit
+        self.projection = np.array([player['projection'] for player in pool],
+                                   dtype=np.float64)
+        self.eligible = np.array(
+            [[slot in player['positions'] for slot in self.slot_order]
+             for player in pool], dtype=bool).reshape(len(pool), len(slots))
+        self.base_eligible = self.eligible.copy()
+        self.max_units = max_salary // self.unit
+        self.min_units = -(-settings['min_salary'] // self.unit)
+
+        # Mixed-radix index over how many of each slot are filled
+        caps = [slots[slot] for slot in self.slot_order]
+        strides = []
+        stride = 1
+        for cap in caps:
+            strides.append(stride)
+            stride *= cap + 1
+        self.states = stride
+        self.full_state = sum(cap * s for cap, s in zip(caps, strides))
+        self.strides = strides
+        # Filling slot t moves a state one step along digit t, so each
+        # transition is a pair of strided views of the (state, salary) grid
+        self.transitions = []
+        for cap, s in zip(caps, strides):
+            self.transitions.append((self.states // (s * (cap + 1)), cap, s))
+
+        games = {}
+        team_members = {}
+        self.games = np.zeros(len(pool), dtype=np.int64)
+        for i, player in enumerate(pool):
+            self.games[i] = games.setdefault(player['game'], len(games))
+            if set(player['positions']) <= rules['team_limit_exempt']:
+                continue
+            team_members.setdefault(player['team'], []).append(i)
+        self.team_members = [np.array(m) for m in team_members.values()]
+        self.check_games = len(games) >= self.min_games
+        self.stacks = compile_stacks(pool, sport, settings)
+        if self.stacks['team_stacks']:
+            raise ValueError('Team stacks need the cbc solver')
+
+        self.base_forced = {i for i, player in enumerate(pool) if player['lock']}
+        self.forced = set(self.base_forced)
+        self.excluded = set()
+        self.cuts = []
+        self.fixed = []
+        # DP results only depend on the forced/excluded sets, so branch
+        # and bound nodes are shared between solves
+        self.memo = OrderedDict()
+        # Set when the last solve gave up at MAX_NODES rather than
+        # proving no lineup is left
+        self.node_limit_reached = False
+        # Solves run to the end; only LineupModel stops at a time limit
+        self.time_limited = False
+        self.build_time = time.perf_counter() - started
+
+    def exclude(self, i):
+        self.excluded.add(i)
+
+    def force(self, i):
+        self.forced.add(i)
+
+    def include(self, i):
+        self.excluded.discard(i)
+
+    def fix(self, i, slot):
+        # Pinning a slot changes the DP itself, so cached nodes are dropped
+        self.eligible[i] = False
+        self.eligible[i, self.slot_order.index(slot)] = True
+        self.forced.add(i)
+        self.fixed.append(i)
+        self.memo.clear()
+
+    def release(self):
+        if not self.fixed:
+            return
+        for i in self.fixed:
+            self.eligible[i] = self.base_eligible[i]
+            if i not in self.base_forced:
+                self.forced.discard(i)
+        self.fixed = []
+        self.memo.clear()
+
+    def add_uniqueness_cut(self, lineup):
+        self.cuts.append(np.array(sorted(i for i, _ in lineup)))
+
+    def reset(self):
+        self.release()
+        self.forced = set(self.base_forced)
+        self.excluded = set()
+        self.cuts = []
+
+    def run_dp(self, forced, excluded):
+        key = (forced, excluded)
+        if key in self.memo:
+            self.memo.move_to_end(key)
+            return self.memo[key]
+        result = self._run_dp(forced, excluded)
+        self.memo[key] = result
+        if len(self.memo) > MEMO_SIZE:
+            self.memo.popitem(last=False)
+        return result
+
+    def _run_dp(self, forced, excluded):
+        """
+        Best lineup for the slot and salary rules alone. Returns
+        (projection, lineup) or None when the forced players cannot all
+        fit.
+        """
+        width = self.max_units + 1
+        values = np.full((self.states, width), -np.inf)
+        values[0, 0] = 0.0
+        taken = []
+        order = [i for i in range(len(self.pool)) if i not in excluded]
+        for i in order:
+            cost = self.salary[i]
+            if cost >= width:
+                taken.append(None)
+                continue
+            gain = self.projection[i] + (FORCE_BONUS if i in forced else 0.0)
+            updated = values.copy()
+            choice = np.zeros((self.states, width), dtype=np.int8)
+            for t in np.nonzero(self.eligible[i])[0]:
+                outer, cap, inner = self.transitions[t]
+                shape = (outer, cap + 1, inner, width)
+                candidate = values.reshape(shape)[:, :cap, :, :width - cost] + gain
+                current = updated.reshape(shape)[:, 1:, :, cost:]
+                better = candidate > current
+                np.copyto(current, candidate, where=better)
+                np.copyto(choice.reshape(shape)[:, 1:, :, cost:], t + 1, where=better)
+            values = updated
+            taken.append(choice)
+
+        final = values[self.full_state, self.min_units:]
+        if final.size == 0 or not np.isfinite(final).any():
+            return None
+        units = int(np.argmax(final)) + self.min_units
+        best = values[self.full_state, units]
+        if best < len(forced) * FORCE_BONUS - 1:
+            return None
+
+        lineup = []
+        state = self.full_state
+        for i, choice in zip(reversed(order), reversed(taken)):
+            if choice is None:
+                continue
+            t = choice[state, units]
+            if t:
+                t -= 1
+                lineup.append((i, self.slot_order[t]))
+                state -= self.strides[t]
+                units -= self.salary[i]
+        lineup.sort(key=lambda entry: self.slot_order.index(entry[1]))
+        return best - len(forced) * FORCE_BONUS, lineup
+
+    def conflict(self, lineup, forced, excluded):
+        """
+        Branches that repair the first side constraint the lineup breaks,
+        as (players to force, players to exclude) pairs, or None if it is
+        valid. An empty list means the node cannot be repaired.
+        """
+        members = np.array(sorted(i for i, _ in lineup))
+        for team in self.team_members:
+            in_team = np.intersect1d(members, team)
+            if len(in_team) > self.max_per_team:
+                return removal_branches(in_team, forced)
+        if self.check_games and len(np.unique(self.games[members])) < self.min_games:
+            return removal_branches(members, forced)
+        stack = stack_conflict(self.stacks, members)
+        if stack is not None:
+            remove, add = stack
+            branches = removal_branches(remove, forced)
+            kept = set(remove)
+            branches.extend((kept | {i}, set()) for i in add if i not in excluded)
+            return branches
+        for cut in self.cuts:
+            overlap = np.intersect1d(members, cut)
+            if len(overlap) > self.size - self.uniques:
+                return removal_branches(overlap, forced)
+        return None
+
+    def solve(self):
+        self.node_limit_reached = False
+        forced = frozenset(self.forced)
+        excluded = frozenset(self.excluded - self.forced)
+        if self.forced & self.excluded:
+            return None
+        heap = [(-np.inf, 0, forced, excluded, None)]
+        counter = 1
+        nodes = 0
+        while heap and nodes < MAX_NODES:
+            bound, _, forced, excluded, result = heapq.heappop(heap)
+            if result is None:
+                nodes += 1
+                result = self.run_dp(forced, excluded)
+                if result is not None:
+                    heapq.heappush(heap, (-result[0], counter, forced, excluded, result))
+                    counter += 1
+                continue
+            lineup = result[1]
+            branches = self.conflict(lineup, forced, excluded)
+            if branches is None:
+                return lineup
+            for force, exclude in branches:
+                heapq.heappush(heap, (bound, counter, forced | force,
+                                      excluded | exclude, None))
+                counter += 1
+        self.node_limit_reached = bool(heap)
+        return None
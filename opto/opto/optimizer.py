@@ -0,0 +1,611 @@
+import hashlib
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pulp
+
+from .bitsets import is_unique, pack_lineups, player_counts
+from .numpy_solver import NumpyLineupModel
+from .rosters import ROSTER_RULES, roster_size, team_limit
+from .stacking import compile_stacks
+
+MAX_LINEUPS = 150
+# Most lineups the synchronous optimize endpoints build; larger builds
+# run as jobs so they cannot outlast the web worker's timeout
+MAX_SYNC_LINEUPS = 20
+# Seconds CBC may spend on one lineup before returning the best it has
+SOLVE_TIME_LIMIT = 0.5
+# Lineups each parallel partition solves, as a multiple of its even share
+OVERSAMPLE = 2
+
+
+def build_player_pool(players, user_players, sport):
+    """
+    Flatten Player rows and the user's UserPlayer overrides into the
+    plain dicts the optimizer works on. Removed players and players with
+    no eligible roster slot are dropped.
+    """
+    slots = ROSTER_RULES[sport]['slots']
+    pool = []
+    for player in players:
+        user_player = user_players.get(player.id)
+        if user_player is not None:
+            if user_player.remove:
+                continue
+            projection = float(user_player.projection)
+            lock = user_player.lock
+            exposure = float(user_player.exposure)
+        else:
+            projection = float(player.projection)
+            lock = False
+            exposure = 100.0
+        positions = [slot for slot in slots if getattr(player, slot)]
+        if not positions:
+            continue
+        team = player.team.abbrev
+        pool.append({
+            'id': player.id,
+            'name': player.name,
+            'team': team,
+            'opponent': player.opponent,
+            'game': '@'.join(sorted([team, player.opponent or ''])),
+            'salary': player.salary,
+            'projection': projection,
+            'positions': positions,
+            'lock': lock,
+            'exposure': exposure,
+        })
+    return pool
+
+
+def opto_settings(settings_object, stacks=None):
+    settings = {
+        'uniques': settings_object.uniques,
+        'min_salary': settings_object.min_salary,
+        'max_salary': settings_object.max_salary,
+        'max_players_per_team': settings_object.max_players_per_team,
+    }
+    # Most players allowed against the lineup's own DST or pitcher
+    if hasattr(settings_object, 'offense_vs_defense'):
+        settings['max_vs_opponent'] = settings_object.offense_vs_defense
+    elif hasattr(settings_object, 'hittersVsPitcher'):
+        settings['max_vs_opponent'] = settings_object.hittersVsPitcher
+    settings.update(stacks or {})
+    return settings
+
+
+def exposure_cap(player, num_lineups):
+    if player['lock'] or player['exposure'] >= 100:
+        return num_lineups
+    return math.floor(max(player['exposure'], 0) / 100 * num_lineups)
+
+
+def linked(subset, patterns):
+    """
+    Whether the slot types in subset are connected through players
+    eligible for more than one of them.
+    """
+    reached = {next(iter(subset))}
+    grew = True
+    while grew:
+        grew = False
+        for pattern in patterns:
+            shared = pattern & subset
+            if shared & reached and not shared <= reached:
+                reached |= shared
+                grew = True
+    return reached == subset
+
+
+def slot_groups(pool, slots):
+    """
+    Hall's condition for filling the roster's slots: for every set of
+    slot types, a lineup needs at least as many players eligible for one
+    of them as there are slots of those types. A set that splits into
+    parts no player is eligible across is the sum of their rows, sets
+    with the same eligible players share one row, and sets every player
+    is eligible for already follow from the roster size. Returns (pool
+    indices, slot type sets) per row.
+    """
+    patterns = {}
+    for i, player in enumerate(pool):
+        patterns.setdefault(frozenset(player['positions']), []).append(i)
+    groups = {}
+    for r in range(1, len(slots) + 1):
+        for subset in itertools.combinations(slots, r):
+            if not linked(set(subset), patterns):
+                continue
+            covered = frozenset(pattern for pattern in patterns if pattern & set(subset))
+            if len(covered) < len(patterns):
+                groups.setdefault(covered, []).append(set(subset))
+    return [(sorted(i for pattern in covered for i in patterns[pattern]), subsets)
+            for covered, subsets in groups.items()]
+
+
+class LineupModel:
+    """
+    Classic roster MILP for one player pool and settings. The model is
+    built once; each solve is followed by a uniqueness cut, and reset()
+    drops the cuts so a cached model can serve the next request.
+    solve() returns None only when no lineup is left.
+
+    There is one binary per player rather than one per player and slot,
+    so CBC never branches between slot assignments of the same players;
+    with per-slot variables every cut made the next solve slower, and
+    the 40th lineup of an 8-game NBA slate took seconds. Slot counts are
+    kept feasible by the slot_groups rows, and the chosen players are
+    matched to slots after each solve.
+
+    Each cut still leaves CBC more near-best lineups to rule out, so a
+    solve stops after SOLVE_TIME_LIMIT seconds with the best lineup found
+    and time_limited set; such lineups are almost always optimal but not
+    proven so. Every solve starts a fresh CBC process with no warm start,
+    since the last solution breaks the cut just added.
+    """
+
+    def __init__(self, pool, sport, settings):
+        started = time.perf_counter()
+        rules = ROSTER_RULES[sport]
+        slots = rules['slots']
+        self.pool = pool
+        self.slots = slots
+        self.slot_order = list(slots)
+        self.size = roster_size(sport)
+        self.uniques = min(max(settings['uniques'], 1), self.size)
+        self.solver = pulp.PULP_CBC_CMD(msg=False, timeLimit=SOLVE_TIME_LIMIT)
+        self.exact_solver = pulp.PULP_CBC_CMD(msg=False)
+        self.cuts = []
+        self.fixed = []
+        self.node_limit_reached = False
+        self.time_limited = False
+
+        prob = pulp.LpProblem('lineup', pulp.LpMaximize)
+        picked = [pulp.LpVariable(f'x_{i}', cat='Binary') for i in range(len(pool))]
+        prob += pulp.lpSum(player['projection'] * picked[i] for i, player in enumerate(pool))
+        prob += pulp.lpSum(picked) == self.size
+
+        self.slot_groups = slot_groups(pool, slots)
+        self.slot_rows = []
+        for g, (members, subsets) in enumerate(self.slot_groups):
+            name = f'slots_{g}'
+            prob += pulp.lpSum(picked[i] for i in members) >= \
+                max(sum(slots[slot] for slot in subset) for subset in subsets), name
+            self.slot_rows.append(name)
+        for i, player in enumerate(pool):
+            if player['lock']:
+                prob += picked[i] == 1
+
+        salary = pulp.lpSum(player['salary'] * picked[i]
+                            for i, player in enumerate(pool))
+        prob += salary <= min(settings['max_salary'], rules['salary_cap'])
+        prob += salary >= settings['min_salary']
+
+        teams = {}
+        games = {}
+        for i, player in enumerate(pool):
+            games.setdefault(player['game'], []).append(i)
+            if set(player['positions']) <= rules['team_limit_exempt']:
+                continue
+            teams.setdefault(player['team'], []).append(i)
+        max_per_team = team_limit(sport, settings)
+        for members in teams.values():
+            prob += pulp.lpSum(picked[i] for i in members) <= max_per_team
+        if len(games) >= rules['min_games']:
+            game_vars = []
+            for g, members in enumerate(games.values()):
+                game_var = pulp.LpVariable(f'g_{g}', cat='Binary')
+                prob += game_var <= pulp.lpSum(picked[i] for i in members)
+                game_vars.append(game_var)
+            prob += pulp.lpSum(game_vars) >= rules['min_games']
+
+        stacks = compile_stacks(pool, sport, settings)
+        for indices, coefficients, rhs in stacks['rows']:
+            prob += pulp.lpSum(c * picked[i] for i, c in zip(indices, coefficients)) <= rhs
+        if stacks['team_stacks']:
+            team_vars = [[] for _ in stacks['teams']]
+            for s, stack_size in enumerate(stacks['team_stacks']):
+                stack_vars = []
+                for t, members in enumerate(stacks['teams']):
+                    stack_var = pulp.LpVariable(f's_{s}_{t}', cat='Binary')
+                    prob += stack_size * stack_var <= pulp.lpSum(picked[i] for i in members)
+                    stack_vars.append(stack_var)
+                    team_vars[t].append(stack_var)
+                prob += pulp.lpSum(stack_vars) >= 1
+            # Each stack comes from a different team
+            for stack_vars in team_vars:
+                prob += pulp.lpSum(stack_vars) <= 1
+
+        self.prob = prob
+        self.picked = picked
+        self.build_time = time.perf_counter() - started
+
+    def exclude(self, i):
+        self.picked[i].upBound = 0
+
+    def force(self, i):
+        name = f'force_{i}'
+        self.prob += self.picked[i] == 1, name
+        self.cuts.append(name)
+
+    def include(self, i):
+        self.picked[i].upBound = 1
+
+    def fix(self, i, slot):
+        self.picked[i].lowBound = 1
+        self.picked[i].upBound = 1
+        self.fixed.append((i, slot))
+        self.set_slot_rows()
+
+    def release(self):
+        for i, _ in self.fixed:
+            self.picked[i].lowBound = 0
+        self.fixed = []
+        self.set_slot_rows()
+
+    def set_slot_rows(self):
+        """
+        Tighten the slot rows for fixed players: a player fixed in one
+        slot cannot fill any other, so every slot type set needs its
+        open slots covered by the remaining players.
+        """
+        for name, (_, subsets) in zip(self.slot_rows, self.slot_groups):
+            needed = 0
+            for subset in subsets:
+                count = sum(self.slots[slot] for slot in subset)
+                for i, slot in self.fixed:
+                    count += bool(subset & set(self.pool[i]['positions'])) - (slot in subset)
+                needed = max(needed, count)
+            self.prob.constraints[name].constant = -needed
+
+    def add_uniqueness_cut(self, lineup):
+        name = f'cut_{len(self.cuts)}'
+        self.prob += pulp.lpSum(self.picked[i] for i, _ in lineup) <= \
+            self.size - self.uniques, name
+        self.cuts.append(name)
+
+    def reset(self):
+        for name in self.cuts:
+            del self.prob.constraints[name]
+        self.cuts = []
+        self.release()
+        for var in self.picked:
+            var.upBound = 1
+
+    def assign_slots(self, chosen):
+        """
+        Match the chosen players to roster slots, fixed players keeping
+        theirs; the slot rows guarantee a full matching exists.
+        """
+        open_slots = [slot for slot, count in self.slots.items() for _ in range(count)]
+        for _, slot in self.fixed:
+            open_slots.remove(slot)
+        fixed = {i for i, _ in self.fixed}
+        holder = {}
+
+        def augment(i, seen):
+            for s, slot in enumerate(open_slots):
+                if s in seen or slot not in self.pool[i]['positions']:
+                    continue
+                seen.add(s)
+                if s not in holder or augment(holder[s], seen):
+                    holder[s] = i
+                    return True
+            return False
+
+        for i in chosen:
+            if i not in fixed:
+                augment(i, set())
+        lineup = list(self.fixed) + [(i, open_slots[s]) for s, i in holder.items()]
+        lineup.sort(key=lambda entry: self.slot_order.index(entry[1]))
+        return lineup
+
+    def solve(self):
+        self.prob.solve(self.solver)
+        self.time_limited = self.prob.sol_status == pulp.LpSolutionIntegerFeasible
+        if pulp.LpStatus[self.prob.status] == 'Not Solved':
+            # Out of time before finding any lineup
+            self.prob.solve(self.exact_solver)
+        if pulp.LpStatus[self.prob.status] != 'Optimal':
+            return None
+        return self.assign_slots([i for i, var in enumerate(self.picked)
+                                  if var.varValue is not None and var.varValue > 0.5])
+
+
+SOLVER_BACKENDS = {
+    'cbc': LineupModel,
+    'numpy': NumpyLineupModel,
+}
+
+_model_cache = OrderedDict()
+MODEL_CACHE_SIZE = 8
+
+
+def model_key(pool, sport, settings, backend):
+    signature = [(p['id'], p['salary'], p['projection'], p['lock'],
+                  tuple(p['positions'])) for p in pool]
+    settings_items = sorted(settings.items())
+    return hashlib.sha1(
+        repr((sport, backend, signature, settings_items)).encode()).hexdigest()
+
+
+def get_lineup_model(pool, sport, settings, backend='cbc'):
+    if backend not in SOLVER_BACKENDS:
+        raise ValueError(f'Unknown solver backend: {backend}')
+    key = model_key(pool, sport, settings, backend)
+    model = _model_cache.get(key)
+    if model is None:
+        model = SOLVER_BACKENDS[backend](pool, sport, settings)
+        _model_cache[key] = model
+        if len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    else:
+        _model_cache.move_to_end(key)
+        model.reset()
+        model.build_time = 0.0
+    return model
+
+
+def generate_lineups(pool, sport, settings, num_lineups, forced=(),
+                     excluded=(), existing=(), backend='cbc', progress=None):
+    """
+    Solve up to num_lineups lineups, best first, on one reused model.
+    After each solution a uniqueness cut forces the next lineup to differ
+    from it by at least settings['uniques'] players. Lineups in existing
+    are cut and count toward exposures but are not returned. progress is
+    called with the running lineup count. Returns the lineups as lists of
+    (pool index, slot) plus build and per-lineup solve times; the stats
+    flag node_limit_reached when the numpy backend gave up searching
+    before num_lineups were found, and count the lineups CBC returned at
+    its time limit as time_limited.
+    """
+    model = get_lineup_model(pool, sport, settings, backend)
+    total = num_lineups + len(existing)
+    caps = {i: exposure_cap(player, total) for i, player in enumerate(pool)}
+    counts = {i: 0 for i in caps}
+    for lineup in existing:
+        model.add_uniqueness_cut(lineup)
+        for i, _ in lineup:
+            counts[i] += 1
+    for i in forced:
+        model.force(i)
+    for i in excluded:
+        model.exclude(i)
+    for i, cap in caps.items():
+        if counts[i] >= cap:
+            model.exclude(i)
+
+    lineups = []
+    solve_times = []
+    time_limited = 0
+    while len(lineups) < num_lineups:
+        started = time.perf_counter()
+        lineup = model.solve()
+        solve_times.append(time.perf_counter() - started)
+        if lineup is None:
+            break
+        lineups.append(lineup)
+        time_limited += model.time_limited
+        model.add_uniqueness_cut(lineup)
+        for i, _ in lineup:
+            counts[i] += 1
+            if counts[i] == caps[i]:
+                model.exclude(i)
+        if progress is not None:
+            progress(len(existing) + len(lineups))
+
+    if not lineups and not existing:
+        if model.node_limit_reached:
+            raise ValueError('The numpy solver hit its search limit before finding a lineup; '
+                             'try the cbc solver')
+        raise ValueError('No valid lineups for these settings')
+    stats = {
+        'build_time': round(model.build_time, 4),
+        'solve_times': [round(t, 4) for t in solve_times[:len(lineups)]],
+    }
+    if model.node_limit_reached:
+        stats['node_limit_reached'] = True
+    if time_limited:
+        stats['time_limited'] = time_limited
+    return lineups, stats
+
+
+def _solve_partition(args):
+    pool, sport, settings, count, forced, excluded, backend = args
+    try:
+        return generate_lineups(pool, sport, settings, count, forced=forced,
+                                excluded=excluded, backend=backend)
+    except ValueError:
+        return [], {'build_time': 0.0, 'solve_times': []}
+
+
+def merge_lineups(pool, sport, settings, candidates, num_lineups):
+    """
+    Greedily keep the highest projected candidates that respect the
+    global uniques setting and exposure caps.
+    """
+    size = roster_size(sport)
+    max_overlap = size - min(max(settings['uniques'], 1), size)
+    caps = np.array([exposure_cap(player, num_lineups) for player in pool])
+    counts = np.zeros(len(pool), dtype=np.int64)
+    candidates = sorted(
+        candidates, key=lambda lineup: -sum(pool[i]['projection'] for i, _ in lineup))
+    bits = pack_lineups(candidates, len(pool))
+    merged = []
+    merged_bits = np.zeros((num_lineups, bits.shape[1]), dtype=np.uint64)
+    for lineup, lineup_bits in zip(candidates, bits):
+        if len(merged) == num_lineups:
+            break
+        members = [i for i, _ in lineup]
+        if (counts[members] >= caps[members]).any():
+            continue
+        if not is_unique(merged_bits[:len(merged)], lineup_bits, max_overlap):
+            continue
+        merged_bits[len(merged)] = lineup_bits
+        merged.append(lineup)
+        counts[members] += 1
+    return merged
+
+
+def generate_lineups_parallel(pool, sport, settings, num_lineups, workers=None,
+                              backend='cbc', progress=None, oversample=OVERSAMPLE):
+    """
+    Fan lineup generation out over a process pool. The optimal lineup
+    splits the remaining lineups into disjoint partitions (partition k
+    forces its first k players in and its k-th player out); each worker
+    solves the best lineups of one partition, then a merge step applies
+    the global uniques and exposure rules and tops up any shortfall.
+
+    This trades lineup quality for wall time and does not reproduce the
+    sequential build. Each partition applies uniqueness cuts among its
+    own lineups only and solves oversample times its even share of them,
+    so the merge picks from a different, smaller candidate set and the
+    later lineups usually project a few points below their sequential
+    counterparts. Solving more per partition narrows the gap without
+    closing it and soon costs more than generate_lineups; use that when
+    the exact best-first order matters.
+    """
+    started = time.perf_counter()
+    best, stats = generate_lineups(pool, sport, settings, 1, backend=backend)
+    best = best[0]
+    if num_lineups == 1:
+        return [best], stats
+
+    partitions = []
+    for k, (i, _) in enumerate(best):
+        if pool[i]['lock']:
+            continue
+        forced = [j for j, _ in best[:k]]
+        partitions.append((forced, [i]))
+    count = min(num_lineups - 1,
+                math.ceil(oversample * (num_lineups - 1) / max(len(partitions), 1)))
+    workers = min(workers or os.cpu_count() or 1, len(partitions)) or 1
+    jobs = [(pool, sport, settings, count, forced, excluded, backend)
+            for forced, excluded in partitions]
+    candidates = [best]
+    solve_times = list(stats['solve_times'])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for lineups, partition_stats in executor.map(_solve_partition, jobs):
+            candidates.extend(lineups)
+            solve_times.extend(partition_stats['solve_times'])
+
+    lineups = merge_lineups(pool, sport, settings, candidates, num_lineups)
+    if progress is not None:
+        progress(len(lineups))
+    if len(lineups) < num_lineups:
+        extra, extra_stats = generate_lineups(
+            pool, sport, settings, num_lineups - len(lineups), existing=lineups,
+            backend=backend, progress=progress)
+        lineups.extend(extra)
+        solve_times.extend(extra_stats['solve_times'])
+        if extra_stats.get('node_limit_reached'):
+            stats['node_limit_reached'] = True
+    stats = {
+        'build_time': stats['build_time'],
+        'solve_times': solve_times,
+        'partitions': len(partitions),
+        'workers': workers,
+        'wall_time': round(time.perf_counter() - started, 4),
+        **({'node_limit_reached': True} if stats.get('node_limit_reached') else {}),
+    }
+    return lineups, stats
+
+
+def late_swap(pool, sport, settings, lineups, started, backend='cbc'):
+    """
+    Re-solve the open slots of existing lineups once games start. Players
+    on teams in started stay in their slots and every other started
+    player is out; the open slots are filled one lineup at a time on one
+    model, keeping the uniques setting between swapped lineups and the
+    exposure caps across all of them. A lineup whose open slots cannot be
+    filled under those rules is kept as it was. Kept lineups are cut
+    like swapped ones, so no swap can duplicate them.
+    """
+    # Locks only apply to new builds; started players are the locks here
+    pool = [dict(player, lock=False) for player in pool]
+    model = get_lineup_model(pool, sport, settings, backend)
+    caps = {i: exposure_cap(player, len(lineups)) for i, player in enumerate(pool)}
+    counts = {i: 0 for i in caps}
+    started_players = {i for i, player in enumerate(pool) if player['team'] in started}
+    locked = []
+    for lineup in lineups:
+        locked.append([(i, slot) for i, slot in lineup if i in started_players])
+        for i, _ in locked[-1]:
+            counts[i] += 1
+    for i in started_players:
+        model.exclude(i)
+    for i, cap in caps.items():
+        if counts[i] >= cap and i not in started_players:
+            model.exclude(i)
+
+    size = roster_size(sport)
+    for lineup, fixed in zip(lineups, locked):
+        if len(fixed) == size:
+            model.add_uniqueness_cut(lineup)
+    swapped = []
+    solve_times = []
+    node_limit_reached = False
+    for lineup, fixed in zip(lineups, locked):
+        if len(fixed) == size:
+            swapped.append(lineup)
+            continue
+        for i, slot in fixed:
+            model.include(i)
+            model.fix(i, slot)
+        started_at = time.perf_counter()
+        result = model.solve()
+        solve_times.append(time.perf_counter() - started_at)
+        model.release()
+        for i, _ in fixed:
+            model.exclude(i)
+        if result is None:
+            node_limit_reached |= model.node_limit_reached
+            result = lineup
+        model.add_uniqueness_cut(result)
+        for i, _ in result:
+            if i in started_players:
+                continue
+            counts[i] += 1
+            if counts[i] == caps[i]:
+                model.exclude(i)
+        swapped.append(result)
+
+    stats = {
+        'build_time': round(model.build_time, 4),
+        'solve_times': [round(t, 4) for t in solve_times],
+    }
+    if node_limit_reached:
+        stats['node_limit_reached'] = True
+    return swapped, stats
+
+
+def serialize_lineups(pool, lineups):
+    serialized = []
+    for lineup in lineups:
+        players = []
+        for i, slot in lineup:
+            player = pool[i]
+            players.append({
+                'id': str(player['id']),
+                'name': player['name'],
+                'position': slot,
+                'team': player['team'],
+                'salary': player['salary'],
+                'projection': round(player['projection'], 2),
+            })
+        serialized.append({
+            'players': players,
+            'salary': sum(p['salary'] for p in players),
+            'projection': round(sum(pool[i]['projection'] for i, _ in lineup), 2),
+        })
+    return serialized
+
+
+def lineup_exposures(pool, lineups):
+    counts = player_counts(pack_lineups(lineups, len(pool)), len(pool))
+    return {str(pool[i]['id']): round(int(counts[i]) / len(lineups) * 100, 1)
+            for i in np.nonzero(counts)[0]}
@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+
+from .bitsets import contains, pack_lineups, popcount
+from .contest import membership, sample_field
+from .optimizer import SOLVER_BACKENDS, exposure_cap
+from .rosters import roster_size
+from .simulation import draw_projections
+
+# Candidate lineups cost 0.1-0.2s each on a 200-250 player pool
+MAX_PORTFOLIO_POOL = 1000
+SIM_CHUNK = 256
+# Draws solved per candidate wanted, before giving up on duplicates
+POOL_DRAWS_PER_LINEUP = 3
+
+
+def candidate_pool(pool, sport, settings, size, num_lineups, volatility=0.25, backend='cbc',
+                   seed=None, progress=None):
+    """
+    Up to `size` distinct lineups for a portfolio of num_lineups, each
+    the optimal lineup for one perturbed draw of the projections. Every
+    draw is a fresh single solve, so unlike a run of uniqueness cuts the
+    cost per lineup stays flat as the pool grows. Players whose exposure
+    cap rounds to zero lineups are left out of every draw. progress is
+    called with the running lineup count.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    projections = np.array([player['projection'] for player in pool], dtype=np.float32)
+    capped = [i for i, player in enumerate(pool) if exposure_cap(player, num_lineups) == 0]
+    lineups = {}
+    draws = 0
+    while len(lineups) < size and draws < size * POOL_DRAWS_PER_LINEUP:
+        draw = draw_projections(projections, 1, volatility, rng)[0]
+        draws += 1
+        draw_pool = [dict(player, projection=float(points))
+                     for player, points in zip(pool, draw)]
+        model = SOLVER_BACKENDS[backend](draw_pool, sport, settings)
+        for i in capped:
+            model.exclude(i)
+        lineup = model.solve()
+        if lineup is None:
+            continue
+        members = tuple(sorted(i for i, _ in lineup))
+        if members not in lineups:
+            lineups[members] = lineup
+            if progress is not None:
+                progress(len(lineups))
+    if not lineups:
+        raise ValueError('No valid lineups for these settings')
+    stats = {
+        'pool_draws': draws,
+        'pool_build_time': round(time.perf_counter() - started, 4),
+    }
+    return list(lineups.values()), stats
+
+
+def hit_bits(pool, sport, lineups, sims, volatility, top_share, rng,
+             ownership=None, field_size=5000):
+    """
+    M x W uint64 bitsets over simulations: bit k of lineup j is set when
+    it scores a top finish in draw k. A top finish beats the top_share
+    quantile of an ownership-weighted field when ownership is given,
+    otherwise of the lineup pool itself. Draws are scored in chunks so
+    the M x sims score matrix is never held at once. Also returns each
+    lineup's mean score.
+    """
+    projections = np.array([player['projection'] for player in pool], dtype=np.float32)
+    pool_matrix = membership(np.array([[i for i, _ in lineup] for lineup in lineups]),
+                             len(pool))
+    field_matrix = None
+    if ownership is not None:
+        field_matrix = membership(sample_field(pool, sport, ownership, field_size, rng),
+                                  len(pool))
+    words = -(-sims // 64)
+    hits = np.zeros((len(lineups), words * 8), dtype=np.uint8)
+    totals = np.zeros(len(lineups))
+    for start in range(0, sims, SIM_CHUNK):
+        count = min(SIM_CHUNK, sims - start)
+        draws = draw_projections(projections, count, volatility, rng)
+        scores = draws @ pool_matrix
+        totals += scores.sum(axis=0)
+        reference = scores if field_matrix is None else draws @ field_matrix
+        thresholds = np.quantile(reference, 1 - top_share, axis=1)
+        hit = scores >= thresholds[:, None]
+        hits[:, start // 8:start // 8 + -(-count // 8)] = np.packbits(
+            hit.T, axis=1, bitorder='little')
+    return hits.view('<u8').astype(np.uint64), totals / sims
+
+
+def select_portfolio(pool, sport, settings, lineups, num_lineups, sims=5000,
+                     volatility=0.25, top_share=0.01, ownership=None, seed=None):
+    """
+    Greedily pick num_lineups from a larger pool, each time taking the
+    lineup that adds the most simulations with a top finish not already
+    covered by the portfolio. Candidates that would break the uniques
+    setting or an exposure cap are skipped, and ties go to the higher
+    mean score. When the pool runs out first the stats carry the
+    shortfall.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    hits, means = hit_bits(pool, sport, lineups, sims, volatility, top_share, rng,
+                           ownership)
+    size = roster_size(sport)
+    max_overlap = size - min(max(settings['uniques'], 1), size)
+    caps = np.array([exposure_cap(player, num_lineups) for player in pool])
+    counts = np.zeros(len(pool), dtype=np.int64)
+    members = pack_lineups(lineups, len(pool))
+    allowed = np.ones(len(lineups), dtype=bool)
+    for i in np.flatnonzero(caps == 0):
+        allowed &= ~contains(members, i)
+    covered = np.zeros(hits.shape[1], dtype=np.uint64)
+    # Mean score only breaks ties between equal gains
+    tiebreak = (means - means.min()) / (np.ptp(means) + 1e-9) * 0.5
+
+    selected = []
+    while len(selected) < num_lineups and allowed.any():
+        gains = popcount(hits & ~covered) + tiebreak
+        gains[~allowed] = -1
+        j = int(np.argmax(gains))
+        allowed[j] = False
+        players = [i for i, _ in lineups[j]]
+        if (counts[players] >= caps[players]).any():
+            continue
+        selected.append(j)
+        covered |= hits[j]
+        allowed &= popcount(members & members[j]) <= max_overlap
+        counts[players] += 1
+        for i in players:
+            if counts[i] >= caps[i]:
+                allowed &= ~contains(members, i)
+
+    if not selected:
+        raise ValueError('No candidate lineups fit the exposure settings')
+    stats = {
+        'pool_size': len(lineups),
+        'sims': sims,
+        'top_rate': round(int(popcount(covered)) / sims * 100, 2),
+        'selection_time': round(time.perf_counter() - started, 4),
+    }
+    if len(selected) < num_lineups:
+        stats['shortfall'] = num_lineups - len(selected)
+    return [lineups[j] for j in selected], stats
@@ -0,0 +1,57 @@
+import copy
+import hashlib
+
+from django.core.cache import caches
+
+
+def result_cache():
+    return caches['optimizations']
+
+
+def version_key(sport, slate_id):
+    return f'opto-version:{sport}:{slate_id}'
+
+
+def slate_version(sport, slate_id):
+    return result_cache().get_or_set(version_key(sport, slate_id), 0, None)
+
+
+def result_key(sport, slate_id, pool, settings, num_lineups, options=()):
+    """
+    Content hash of everything an optimization depends on: the slate and
+    its cache version, the effective projections, locks, exposures and
+    removals baked into the pool, the opto settings and the request
+    options. Identical requests from different users share a key.
+    """
+    signature = [(p['id'], p['salary'], p['projection'], p['lock'],
+                  p['exposure'], tuple(p['positions'])) for p in pool]
+    content = (sport, slate_id, slate_version(sport, slate_id), signature,
+               sorted(settings.items()), num_lineups, tuple(options))
+    return f'opto-result:{hashlib.sha256(repr(content).encode()).hexdigest()}'
+
+
+def get_cached_result(key):
+    result = result_cache().get(key)
+    if result is None:
+        return None
+    lineups, exposures, stats = copy.deepcopy(result)
+    stats['cached'] = True
+    return lineups, exposures, stats
+
+
+def set_cached_result(key, result):
+    result_cache().set(key, result)
+
+
+def invalidate_slate(sport, slate_id):
+    """
+    Bump the slate's version so every cached result for it misses, in
+    every process: the result key covers the pool, but not the names,
+    teams and games a refresh can also change.
+    """
+    cache = result_cache()
+    key = version_key(sport, slate_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
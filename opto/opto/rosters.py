@@ -0,0 +1,53 @@
+from django.apps import apps
+
+# DraftKings Classic roster rules, keyed by sport.
+# Slot names match the boolean position flags on each app's Player model.
+ROSTER_RULES = {
+    'NFL': {
+        'app': 'nfl',
+        'salary_cap': 50000,
+        'slots': {'QB': 1, 'RB': 2, 'WR': 3, 'TE': 1, 'FLEX': 1, 'DST': 1},
+        'min_games': 2,
+        'team_limit': None,
+        'team_limit_exempt': set(),
+    },
+    'NBA': {
+        'app': 'nba',
+        'salary_cap': 50000,
+        'slots': {'PG': 1, 'SG': 1, 'SF': 1, 'PF': 1, 'C': 1, 'G': 1, 'F': 1, 'UTIL': 1},
+        'min_games': 2,
+        'team_limit': None,
+        'team_limit_exempt': set(),
+    },
+    'MLB': {
+        'app': 'mlb',
+        'salary_cap': 50000,
+        'slots': {'P': 2, 'C': 1, 'FB': 1, 'SB': 1, 'TB': 1, 'SS': 1, 'OF': 3},
+        'min_games': 2,
+        # DK only limits hitters per team
+        'team_limit': 5,
+        'team_limit_exempt': {'P'},
+    },
+}
+
+
+def roster_size(sport):
+    return sum(ROSTER_RULES[sport]['slots'].values())
+
+
+def team_limit(sport, settings):
+    """
+    Most players a lineup may take from one team, not counting the
+    sport's exempt positions: the user's max_players_per_team, capped by
+    the site's own limit.
+    """
+    limit = settings['max_players_per_team']
+    site_limit = ROSTER_RULES[sport]['team_limit']
+    return limit if site_limit is None else min(limit, site_limit)
+
+
+def sport_model(sport, name):
+    """
+    The named model from the sport's Django app, e.g. ('NBA', 'Player').
+    """
+    return apps.get_model(ROSTER_RULES[sport]['app'], name)
@@ -131,3 +131,54 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Optimizer results, shared by the web and job worker processes so a
+    # slate invalidation reaches all of them. The table is created by
+    # `manage.py createcachetable`
+    'optimizations': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'opto_result_cache',
+        'TIMEOUT': 6 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        # opto.ingest messages are already JSON
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'ingest': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'opto.ingest': {
+            'handlers': ['ingest'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Prometheus textfile collector output for fetch_dk_slates; empty to skip
+INGEST_METRICS_FILE = os.environ.get('INGEST_METRICS_FILE', '')
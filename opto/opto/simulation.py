@@ -0,0 +1,190 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .optimizer import SOLVER_BACKENDS
+
+MAX_SIMULATIONS = 20000
+# Most simulations the synchronous simulate endpoints draw; a 15-game
+# slate's draws take sims x 630 float32s, so larger runs are jobs
+MAX_SYNC_SIMULATIONS = 10000
+SCORE_CHUNK = 2000
+# Draws solved for candidate lineups; each solve is a full optimizer run
+DEFAULT_SOLVES = 40
+MAX_SOLVES = 500
+# Most solves the synchronous simulate endpoints run (about 0.1s each on
+# a 15-game slate); more go through the job queue
+MAX_SYNC_SOLVES = 50
+
+# Pairwise correlations of player outcomes by relationship
+CORRELATIONS = {
+    'NFL': {'team': 0.15, 'qb_catcher': 0.45, 'game': 0.1, 'dst_offense': -0.3},
+    'NBA': {'team': -0.02, 'game': 0.04},
+    'MLB': {'team': 0.3, 'game': 0.05, 'pitcher_hitter': -0.2},
+}
+
+_factor_cache = OrderedDict()
+FACTOR_CACHE_SIZE = 16
+
+
+def draw_projections(projections, sims, volatility, rng):
+    """
+    K x P matrix of simulated fantasy points, each player drawn around
+    their projection with a standard deviation of volatility * projection.
+    """
+    noise = rng.standard_normal((sims, len(projections)), dtype=np.float32)
+    draws = projections * (1 + volatility * noise)
+    return np.maximum(draws, 0, out=draws)
+
+
+def correlation_matrix(pool, sport, team_weights=None):
+    """
+    P x P correlation of player outcomes. Teammates and players in the
+    same game move together, QBs with their pass catchers most of all,
+    while DSTs and pitchers move against the offense they face. Team
+    correlations are scaled by team_weights where given.
+    """
+    rho = CORRELATIONS[sport]
+    teams = {}
+    team = np.array([teams.setdefault(p['team'], len(teams)) for p in pool])
+    opponent = np.array([teams.setdefault(p['opponent'], len(teams)) for p in pool])
+    same_team = team[:, None] == team[None, :]
+    facing = opponent[:, None] == team[None, :]
+
+    weights = np.ones(len(teams))
+    for abbrev, weight in (team_weights or {}).items():
+        if abbrev in teams:
+            weights[teams[abbrev]] = weight
+    player_weight = weights[team]
+
+    matrix = np.where(same_team, rho['team'] * player_weight[:, None], 0.0)
+    matrix += np.where(facing, rho['game'], 0.0)
+    if sport == 'NFL':
+        qb = np.array(['QB' in p['positions'] for p in pool])
+        catcher = np.array(['WR' in p['positions'] or 'TE' in p['positions']
+                            for p in pool])
+        dst = np.array(['DST' in p['positions'] for p in pool])
+        stack = same_team & ((qb[:, None] & catcher[None, :]) |
+                             (catcher[:, None] & qb[None, :]))
+        matrix = np.where(stack, rho['qb_catcher'], matrix)
+        against = facing & (dst[:, None] ^ dst[None, :])
+        matrix = np.where(against, rho['dst_offense'], matrix)
+        matrix = np.where(same_team & (dst[:, None] | dst[None, :]), 0.0, matrix)
+    elif sport == 'MLB':
+        pitcher = np.array([p['positions'] == ['P'] for p in pool])
+        against = facing & (pitcher[:, None] ^ pitcher[None, :])
+        matrix = np.where(against, rho['pitcher_hitter'], matrix)
+        matrix = np.where(same_team & (pitcher[:, None] | pitcher[None, :]), 0.0, matrix)
+    np.fill_diagonal(matrix, 1.0)
+    return matrix
+
+
+def cholesky_factor(matrix):
+    try:
+        return np.linalg.cholesky(matrix)
+    except np.linalg.LinAlgError:
+        # Clip to the nearest positive definite correlation matrix
+        values, vectors = np.linalg.eigh(matrix)
+        fixed = (vectors * np.maximum(values, 1e-6)) @ vectors.T
+        scale = np.sqrt(np.diag(fixed))
+        return np.linalg.cholesky(fixed / np.outer(scale, scale))
+
+
+def slate_factor(pool, sport, slate_id, team_weights=None):
+    """
+    Cholesky factor of the slate's correlation matrix, cached per slate
+    and player structure so repeated simulations skip the factorization.
+    """
+    structure = tuple((p['id'], p['team'], p['opponent'], tuple(p['positions']))
+                      for p in pool)
+    key = (sport, slate_id, hash(structure),
+           tuple(sorted((team_weights or {}).items())))
+    factor = _factor_cache.get(key)
+    if factor is None:
+        factor = cholesky_factor(correlation_matrix(pool, sport, team_weights))
+        _factor_cache[key] = factor
+        if len(_factor_cache) > FACTOR_CACHE_SIZE:
+            _factor_cache.popitem(last=False)
+    else:
+        _factor_cache.move_to_end(key)
+    return factor
+
+
+def draw_correlated_projections(projections, sims, volatility, rng, factor):
+    noise = rng.standard_normal((sims, len(projections)), dtype=np.float32)
+    noise = noise @ factor.T.astype(np.float32)
+    draws = projections * (1 + volatility * noise)
+    return np.maximum(draws, 0, out=draws)
+
+
+def candidate_lineups(pool, sport, settings, draws, backend):
+    """
+    Optimal lineups for a sample of draws. Each distinct lineup becomes a
+    column of a P x L membership matrix that every simulation is scored
+    against.
+    """
+    lineups = {}
+    for draw in draws:
+        draw_pool = [dict(player, projection=float(points))
+                     for player, points in zip(pool, draw)]
+        lineup = SOLVER_BACKENDS[backend](draw_pool, sport, settings).solve()
+        if lineup is not None:
+            lineups.setdefault(tuple(sorted(i for i, _ in lineup)), lineup)
+    membership = np.zeros((len(pool), len(lineups)), dtype=np.float32)
+    for column, members in enumerate(lineups):
+        membership[list(members), column] = 1
+    return list(lineups.values()), membership
+
+
+def optimal_rates(pool, sport, settings, sims=10000, volatility=0.25,
+                  solves=DEFAULT_SOLVES, seed=None, backend='cbc', draws=None,
+                  factor=None):
+    """
+    Monte Carlo optimal rates for a slate, approximated over a candidate
+    set. Only `solves` sampled draws are solved exactly; all `sims` draws
+    are then scored against those candidate lineups at once and the best
+    candidate of each draw counts as that simulation's optimal. A player
+    in none of the candidates gets no rate even if they would make some
+    draw's true optimal, so rates sharpen as solves grows. Draws are
+    correlated when a Cholesky factor is given. Returns the share of
+    simulations each player and candidate lineup was optimal in.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    projections = np.array([player['projection'] for player in pool],
+                           dtype=np.float32)
+    if draws is None and factor is not None:
+        draws = draw_correlated_projections(
+            projections, sims, volatility, rng, factor)
+    elif draws is None:
+        draws = draw_projections(projections, sims, volatility, rng)
+    sims = len(draws)
+
+    sample = draws[rng.choice(sims, size=min(solves, sims), replace=False)]
+    lineups, membership = candidate_lineups(pool, sport, settings, sample, backend)
+    if not lineups:
+        raise ValueError('No valid lineups for these settings')
+    solve_time = time.perf_counter() - started
+
+    best = np.empty(sims, dtype=np.int64)
+    for start in range(0, sims, SCORE_CHUNK):
+        scores = draws[start:start + SCORE_CHUNK] @ membership
+        best[start:start + SCORE_CHUNK] = np.argmax(scores, axis=1)
+    lineup_rates = np.bincount(best, minlength=len(lineups)) / sims
+    player_rates = membership @ lineup_rates
+
+    return {
+        'sims': sims,
+        'method': 'candidate_set',
+        'solved_draws': len(sample),
+        'candidate_lineups': len(lineups),
+        'player_rates': {str(player['id']): round(float(rate) * 100, 2)
+                         for player, rate in zip(pool, player_rates) if rate > 0},
+        'lineups': lineups,
+        'lineup_rates': [round(float(rate) * 100, 2) for rate in lineup_rates],
+        'timings': {
+            'solve_time': round(solve_time, 4),
+            'total_time': round(time.perf_counter() - started, 4),
+        },
+    }
@@ -0,0 +1,186 @@
+from django.utils import timezone
+
+from .contest import lineup_indexes, simulate_contest
+from .optimizer import (build_player_pool, opto_settings, generate_lineups, generate_lineups_parallel,
+                        late_swap, serialize_lineups, lineup_exposures)
+from .portfolio import candidate_pool, select_portfolio
+from .result_cache import result_key, get_cached_result, set_cached_result
+from .rosters import sport_model
+from .simulation import DEFAULT_SOLVES, optimal_rates, slate_factor
+
+
+def get_player_pool(sport, slate, user):
+    Player = sport_model(sport, 'Player')
+    UserPlayer = sport_model(sport, 'UserPlayer')
+    players = Player.objects.filter(slate=slate, active=True).select_related('team')
+    user_players = {user_player.meta_player_id: user_player for user_player in
+                    UserPlayer.objects.filter(slate=slate, user=user)}
+    return build_player_pool(players, user_players, sport)
+
+
+def get_opto_settings(sport, user, stacks=None):
+    UserOptoSettings = sport_model(sport, 'UserOptoSettings')
+    settings_object = UserOptoSettings.objects.filter(user=user).first()
+    if settings_object is None:
+        settings_object = UserOptoSettings.objects.create(user=user)
+    return opto_settings(settings_object, stacks)
+
+
+def contest_results(sport, slate):
+    """
+    The slate's uploaded ContestResults, or None when there are none or
+    the sport does not store them.
+    """
+    try:
+        ContestResults = sport_model(sport, 'ContestResults')
+    except LookupError:
+        return None
+    return ContestResults.objects.filter(slate=slate).first()
+
+
+def contest_ownership(sport, slate, pool):
+    results = contest_results(sport, slate)
+    if results is None:
+        return None
+    ownership = {row['name'].lower(): row['pct_drafted'] for row in results.player_ownership}
+    return [ownership.get(player['name'].lower(), 0.0) for player in pool]
+
+
+def stack_weights(sport):
+    # Relative rate the field stacks each team, from stored MLB contest results
+    if sport != 'MLB':
+        return None
+    ContestResults = sport_model(sport, 'ContestResults')
+    rates = {}
+    for stacks in ContestResults.objects.values_list('stacks', flat=True):
+        for stack in stacks or []:
+            rates.setdefault(stack['team'], []).append(stack['stack4_pct'])
+    if not rates:
+        return None
+    averages = {team: sum(pcts) / len(pcts) for team, pcts in rates.items()}
+    mean = sum(averages.values()) / len(averages)
+    if mean <= 0:
+        return None
+    return {team: min(max(average / mean, 0.5), 1.5)
+            for team, average in averages.items()}
+
+
+def optimize_slate(sport, slate, user, num_lineups, parallel=False, backend='cbc',
+                   progress=None, stacks=None, portfolio_size=None):
+    pool = get_player_pool(sport, slate, user)
+    settings = get_opto_settings(sport, user, stacks)
+    key = result_key(sport, slate.id, pool, settings, num_lineups,
+                     (parallel, backend, portfolio_size))
+    cached = get_cached_result(key)
+    if cached is not None:
+        return cached
+    generate = generate_lineups_parallel if parallel else generate_lineups
+    if portfolio_size:
+        # Solve a wide pool of lineups for perturbed projections, then
+        # pick the portfolio from it by simulated top finishes
+        def pool_progress(count):
+            progress(count * num_lineups // portfolio_size)
+
+        candidates, stats = candidate_pool(
+            pool, sport, settings, portfolio_size, num_lineups, backend=backend,
+            progress=pool_progress if progress is not None else None)
+        lineups, selection = select_portfolio(
+            pool, sport, settings, candidates, num_lineups,
+            ownership=contest_ownership(sport, slate, pool))
+        stats.update(selection)
+    else:
+        lineups, stats = generate(
+            pool, sport, settings, num_lineups, backend=backend,
+            progress=progress)
+    result = (serialize_lineups(pool, lineups), lineup_exposures(pool, lineups), stats)
+    set_cached_result(key, result)
+    return result
+
+
+def simulate_slate(sport, slate, user, sims, volatility, correlated=False, solves=DEFAULT_SOLVES):
+    pool = get_player_pool(sport, slate, user)
+    factor = slate_factor(pool, sport, slate.id, stack_weights(sport)) if correlated else None
+    results = optimal_rates(
+        pool, sport, get_opto_settings(sport, user), sims=sims, volatility=volatility,
+        solves=solves, factor=factor)
+    results['lineups'] = serialize_lineups(pool, results['lineups'])
+    return results
+
+
+def started_teams(sport, slate, now=None):
+    Game = sport_model(sport, 'Game')
+    started = set()
+    games = Game.objects.filter(slate=slate, time__lte=now or timezone.now()) \
+        .select_related('home_team', 'away_team')
+    for game in games:
+        started.update((game.home_team.abbrev, game.away_team.abbrev))
+    return started
+
+
+def late_swap_optimization(sport, optimization, backend='cbc', now=None):
+    slate = optimization.slate
+    pool = get_player_pool(sport, slate, optimization.user)
+    started = started_teams(sport, slate, now)
+    index = {str(player['id']): i for i, player in enumerate(pool)}
+    gone = {int(player['id']) for lineup in optimization.lineups for player in lineup['players']
+            if player['id'] not in index and player['team'] in started}
+    if gone:
+        # Started players the user removed, or a refresh deactivated, are
+        # still in their lineups; add them back so they keep their slots
+        Player = sport_model(sport, 'Player')
+        players = Player.objects.filter(slate=slate, id__in=gone).select_related('team')
+        for player in build_player_pool(players, {}, sport):
+            index[str(player['id'])] = len(pool)
+            pool.append(player)
+    lineups = []
+    for lineup in optimization.lineups:
+        entry = []
+        for player in lineup['players']:
+            i = index.get(player['id'])
+            if i is not None:
+                entry.append((i, player['position']))
+            elif player['team'] in started:
+                raise ValueError(f"{player['name']} has started but is no longer on the slate")
+        lineups.append(entry)
+    lineups, stats = late_swap(pool, sport, get_opto_settings(sport, optimization.user),
+                               lineups, started, backend)
+    optimization.lineups = serialize_lineups(pool, lineups)
+    optimization.exposures = lineup_exposures(pool, lineups)
+    optimization.save()
+    stats['started-teams'] = sorted(started)
+    return optimization, stats
+
+
+def contest_slate(sport, optimization, field_size, sims, volatility, entry_fee):
+    pool = get_player_pool(sport, optimization.slate, optimization.user)
+    weights = contest_ownership(sport, optimization.slate, pool)
+    if weights is None:
+        raise ValueError('Upload contest results for this slate first')
+    lineups = lineup_indexes(pool, optimization.lineups)
+    return simulate_contest(pool, sport, lineups, weights, field_size=field_size,
+                            sims=sims, volatility=volatility, entry_fee=entry_fee)
+
+
+def run_job(sport, job):
+    OptimizationJob = sport_model(sport, 'OptimizationJob')
+    Optimization = sport_model(sport, 'Optimization')
+    params = job.params
+    if job.kind == 'optimize':
+        num_lineups = params['num-lineups']
+
+        def progress(count):
+            OptimizationJob.objects.filter(pk=job.pk).update(
+                progress=round(count / num_lineups * 100))
+
+        lineups, exposures, stats = optimize_slate(
+            sport, job.slate, job.user, num_lineups, params['parallel'],
+            params['solver'], progress, params.get('stacks'),
+            params.get('portfolio-size'))
+        job.optimization = Optimization.objects.create(
+            lineups=lineups, exposures=exposures, user=job.user, slate=job.slate)
+        job.result = {'timings': stats}
+    else:
+        job.result = simulate_slate(
+            sport, job.slate, job.user, params['sims'], params['volatility'],
+            params['correlated'], params.get('solves', DEFAULT_SOLVES))
+    job.progress = 100
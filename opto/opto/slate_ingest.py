@@ -0,0 +1,226 @@
+import logging
+import random
+
+from django.db import transaction
+
+from .dk_csv import parse_game_time
+from .ingest_metrics import untimed
+from .locks import sport_lock
+from .result_cache import invalidate_slate
+from .rosters import sport_model
+
+logger = logging.getLogger(__name__)
+
+
+def existing_slate(sport, earliest_game_dt):
+    Slate = sport_model(sport, 'Slate')
+    return Slate.objects.filter(sport=sport, date=earliest_game_dt).first()
+
+
+def mapped_slate(sport, dk_id):
+    """
+    The slate a DK draft group created, or None when it has none. This
+    is the only slate a refresh of that draft group may touch: another
+    draft group can share its earliest game time.
+    """
+    DraftGroup = sport_model(sport, 'DraftGroup')
+    draft_group = DraftGroup.objects.filter(dk_id=dk_id).select_related('slate').first()
+    return draft_group.slate if draft_group is not None else None
+
+
+def record_draft_group(sport, dk_id, csv_hash, slate=None, classic=True):
+    DraftGroup = sport_model(sport, 'DraftGroup')
+    DraftGroup.objects.update_or_create(
+        dk_id=dk_id,
+        defaults={'sport': sport, 'csv_hash': csv_hash, 'slate': slate,
+                  'classic': classic},
+    )
+
+
+def create_slate(sport, slate_data, phase=untimed):
+    """
+    Create the slate with its teams, games and players from a parsed
+    DK CSV in one transaction, using bulk inserts and an in-memory
+    abbrev -> Team map instead of a lookup per row. phase times each
+    insert step (see IngestMetrics.phase).
+    """
+    Slate = sport_model(sport, 'Slate')
+    Team = sport_model(sport, 'Team')
+    Player = sport_model(sport, 'Player')
+    Game = sport_model(sport, 'Game')
+
+    with transaction.atomic():
+        with phase('teams', db=True) as record:
+            slate = Slate.objects.create(
+                date=slate_data.earliest_game,
+                game_count=slate_data.game_count,
+                sport=sport,
+            )
+
+            team_objs = Team.objects.bulk_create([
+                Team(abbrev=abbrev, opponent=slate_data.opponents[abbrev], slate=slate)
+                for abbrev in slate_data.teams
+            ])
+            teams_by_abbrev = dict(zip(slate_data.teams, team_objs))
+            record['rows'] = len(team_objs)
+
+        with phase('games', db=True) as record:
+            game_objs = Game.objects.bulk_create([
+                Game(
+                    time=parse_game_time(time_str),
+                    home_team=teams_by_abbrev[home],
+                    away_team=teams_by_abbrev[away],
+                    slate=slate,
+                )
+                for away, home, time_str in slate_data.games.values()
+            ])
+            record['rows'] = len(game_objs)
+
+        with phase('players', db=True) as record:
+            player_objs = []
+            for i, name in enumerate(slate_data.names):
+                code = slate_data.team_codes[i]
+                if code < 0:
+                    logger.warning('Team not found for %s', name)
+                    continue
+                team_obj = team_objs[code]
+                player_objs.append(Player(
+                    name=name,
+                    projection=0,
+                    team=team_obj,
+                    opponent=team_obj.opponent,
+                    dk_id=int(slate_data.ids[i]),
+                    salary=int(slate_data.salaries[i]),
+                    slate=slate,
+                    position=slate_data.positions[i],
+                    **slate_data.position_flags(i, sport),
+                ))
+            Player.objects.bulk_create(player_objs, batch_size=500)
+            record['rows'] = len(player_objs)
+
+    return slate
+
+
+def refresh_slate(sport, slate, slate_data):
+    """
+    Bring an existing slate in line with a newer DK CSV, matching
+    players by dk_id: new players are inserted, changed salaries,
+    positions and teams are updated, and players DK dropped are
+    marked inactive rather than deleted so UserPlayer rows and saved
+    optimizations stay intact. Returns the diff.
+    """
+    Team = sport_model(sport, 'Team')
+    Player = sport_model(sport, 'Player')
+    Game = sport_model(sport, 'Game')
+
+    diff = {'added': 0, 'updated': 0, 'removed': 0, 'teams': 0}
+    with transaction.atomic():
+        teams_by_abbrev = {team.abbrev: team for team in Team.objects.filter(slate=slate)}
+        new_teams = Team.objects.bulk_create([
+            Team(abbrev=abbrev, opponent=slate_data.opponents[abbrev], slate=slate)
+            for abbrev in slate_data.teams if abbrev not in teams_by_abbrev
+        ])
+        teams_by_abbrev.update((team.abbrev, team) for team in new_teams)
+        diff['teams'] = len(new_teams)
+        new_abbrevs = {team.abbrev for team in new_teams}
+        Game.objects.bulk_create([
+            Game(
+                time=parse_game_time(time_str),
+                home_team=teams_by_abbrev[home],
+                away_team=teams_by_abbrev[away],
+                slate=slate,
+            )
+            for away, home, time_str in slate_data.games.values()
+            if home in new_abbrevs and away in new_abbrevs
+        ])
+
+        existing = {player.dk_id: player for player in Player.objects.filter(slate=slate)}
+        seen = set()
+        inserts = []
+        updates = []
+        fields = set()
+        for i, name in enumerate(slate_data.names):
+            team_obj = teams_by_abbrev.get(slate_data.team(i))
+            if team_obj is None:
+                logger.warning('Team not found for %s', name)
+                continue
+            dk_id = int(slate_data.ids[i])
+            seen.add(dk_id)
+            values = {
+                'name': name,
+                'team_id': team_obj.id,
+                'opponent': team_obj.opponent,
+                'salary': int(slate_data.salaries[i]),
+                'position': slate_data.positions[i],
+                'active': True,
+                **slate_data.position_flags(i, sport),
+            }
+            player = existing.get(dk_id)
+            if player is None:
+                inserts.append(Player(projection=0, dk_id=dk_id, slate=slate, **values))
+                continue
+            changed = [field for field, value in values.items()
+                       if getattr(player, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(player, field, values[field])
+                fields.update(changed)
+                updates.append(player)
+
+        removed = [player for dk_id, player in existing.items()
+                   if dk_id not in seen and player.active]
+        for player in removed:
+            player.active = False
+
+        Player.objects.bulk_create(inserts, batch_size=500)
+        if updates:
+            Player.objects.bulk_update(updates, sorted(fields), batch_size=500)
+        if removed:
+            Player.objects.bulk_update(removed, ['active'], batch_size=500)
+        diff.update(added=len(inserts), updated=len(updates), removed=len(removed))
+
+    if any(diff.values()):
+        invalidate_slate(sport, slate.id)
+    return diff
+
+
+def ingest_slate(sport, slate_data, refresh=False, draft_group=None, csv_hash=''):
+    """
+    Create or refresh the slate for a CSV posted to the ingest endpoint.
+    A refresh only updates the slate the draft_group id already maps to;
+    without a mapping the slate is created, or skipped when one already
+    exists for the same earliest game. Holds the same per-sport lock as
+    the fetch run.
+    """
+    if not slate_data.is_classic(sport):
+        return {'skipped': True, 'reason': 'not a classic slate'}, None
+    with transaction.atomic(), sport_lock(sport):
+        mapped = mapped_slate(sport, draft_group) if draft_group is not None else None
+        if mapped is not None:
+            if not refresh:
+                return {'skipped': True, 'reason': 'slate already exists'}, mapped
+            diff = refresh_slate(sport, mapped, slate_data)
+            record_draft_group(sport, draft_group, csv_hash, mapped)
+            return {'refreshed': True, 'slate_id': mapped.id, 'diff': diff}, mapped
+        existing = existing_slate(sport, slate_data.earliest_game)
+        if existing is not None:
+            return {'skipped': True, 'reason': 'slate already exists'}, existing
+        slate = create_slate(sport, slate_data)
+        if draft_group is not None:
+            record_draft_group(sport, draft_group, csv_hash, slate)
+        return {'created': True, 'slate_id': slate.id}, slate
+
+
+def jitter_projections(sport, slate, percentage=7.5):
+    """
+    Randomize each default projection within +/- percentage of itself,
+    in one bulk update.
+    """
+    Player = sport_model(sport, 'Player')
+    players = list(Player.objects.filter(slate=slate, active=True).only('id', 'projection'))
+    for player in players:
+        deviation = percentage / 100 * float(player.projection)
+        player.projection = round(random.uniform(float(player.projection) - deviation,
+                                                 float(player.projection) + deviation), 2)
+    Player.objects.bulk_update(players, ['projection'], batch_size=500)
+    invalidate_slate(sport, slate.id)
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from .rosters import ROSTER_RULES, roster_size
+
+# Anchor positions whose opponents are limited by max_vs_opponent: an
+# NFL DST against the offense it faces, an MLB pitcher against hitters
+OPPONENT_ANCHORS = {
+    'NFL': {'DST'},
+    'MLB': {'P'},
+}
+# QB stacks pair a QB with teammates at these positions
+PASS_CATCHERS = {'WR', 'TE'}
+
+_stack_cache = OrderedDict()
+STACK_CACHE_SIZE = 32
+
+
+def parse_stacks(sport, data):
+    """
+    Stack rules from request data: `qb-stack` is the number of pass
+    catchers to pair with an NFL QB, `team-stacks` a dash separated list
+    of MLB team stack sizes such as 4-3.
+    """
+    stacks = {}
+    if sport == 'NFL':
+        qb_stack = int(data.get('qb-stack', 0) or 0)
+        if qb_stack < 0 or qb_stack > 4:
+            raise ValueError('QB stack must be between 0 and 4 pass catchers')
+        if qb_stack:
+            stacks['qb_stack'] = qb_stack
+    elif sport == 'MLB':
+        sizes = sorted((int(size) for size in str(data.get('team-stacks', '') or '').split('-')
+                        if size.strip()), reverse=True)
+        hitters = roster_size('MLB') - ROSTER_RULES['MLB']['slots']['P']
+        if any(size < 2 for size in sizes) or sum(sizes) > hitters:
+            raise ValueError(f'Team stacks must be at least 2 hitters and total at most {hitters}')
+        limit = ROSTER_RULES['MLB']['team_limit']
+        if any(size > limit for size in sizes):
+            raise ValueError(f'Team stacks can have at most {limit} hitters')
+        if sizes:
+            stacks['team_stacks'] = sizes
+    return stacks
+
+
+def opponent_limit(settings):
+    limit = settings.get('max_vs_opponent')
+    if limit is None or limit < 0:
+        return None
+    return limit
+
+
+def compile_stacks(pool, sport, settings):
+    """
+    Stacking rules as sparse rows over the pool, cached per slate
+    structure. Each row is (indices, coefficients, rhs) meaning
+    sum(coefficients * picked[indices]) <= rhs; team stacks are returned
+    as the required sizes and each team's eligible members.
+    """
+    structure = tuple((p['id'], p['team'], p['opponent'], tuple(p['positions']))
+                      for p in pool)
+    key = (sport, hash(structure), opponent_limit(settings),
+           settings.get('qb_stack', 0), tuple(settings.get('team_stacks', ())))
+    stacks = _stack_cache.get(key)
+    if stacks is None:
+        stacks = _compile_stacks(pool, sport, settings)
+        _stack_cache[key] = stacks
+        if len(_stack_cache) > STACK_CACHE_SIZE:
+            _stack_cache.popitem(last=False)
+    else:
+        _stack_cache.move_to_end(key)
+    return stacks
+
+
+def _compile_stacks(pool, sport, settings):
+    size = roster_size(sport)
+    anchors = OPPONENT_ANCHORS.get(sport, set())
+    by_team = {}
+    for i, player in enumerate(pool):
+        if not set(player['positions']) & anchors:
+            by_team.setdefault(player['team'], []).append(i)
+
+    rows = []
+    limit = opponent_limit(settings)
+    if limit is not None and anchors:
+        for i, player in enumerate(pool):
+            if not set(player['positions']) & anchors:
+                continue
+            facing = by_team.get(player['opponent'], [])
+            big_m = min(len(facing), size - 1)
+            if big_m <= limit:
+                continue
+            # Facing players are free unless the anchor is picked
+            rows.append((np.array(facing + [i]),
+                         np.array([1.0] * len(facing) + [big_m]),
+                         limit + big_m))
+
+    qb_stack = settings.get('qb_stack', 0)
+    if sport == 'NFL' and qb_stack:
+        for i, player in enumerate(pool):
+            if 'QB' not in player['positions']:
+                continue
+            catchers = [j for j in by_team.get(player['team'], [])
+                        if set(pool[j]['positions']) & PASS_CATCHERS]
+            rows.append((np.array(catchers + [i]),
+                         np.array([-1.0] * len(catchers) + [qb_stack]),
+                         0.0))
+
+    team_stacks = list(settings.get('team_stacks', ()))
+    teams = [np.array(members) for members in by_team.values()] if team_stacks else []
+    return {'rows': rows, 'team_stacks': team_stacks, 'teams': teams}
+
+
+def stack_conflict(stacks, members):
+    """
+    For the first stacking row a lineup (sorted pool indices) breaks,
+    the players of which one must go and the players of which one must
+    come in if none of them go. Returns None if the lineup keeps every
+    row. Team stacks are left to the MILP.
+    """
+    for indices, coefficients, rhs in stacks['rows']:
+        in_lineup = np.isin(indices, members)
+        if coefficients[in_lineup].sum() > rhs + 1e-9:
+            remove = indices[in_lineup & (coefficients > 0)]
+            add = indices[~in_lineup & (coefficients < 0)]
+            return list(remove), list(add)
+    return None
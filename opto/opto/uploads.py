@@ -0,0 +1,160 @@
+from codecs import iterdecode
+from csv import DictReader
+
+import numpy as np
+import openpyxl
+from django.db import transaction
+from fuzzywuzzy.fuzz import partial_ratio
+from rapidfuzz import fuzz, process
+
+from .rosters import sport_model
+
+BATCH_SIZE = 500
+
+
+def iter_upload_rows(upload):
+    """
+    Yield the rows of an uploaded CSV or XLSX file as dicts keyed by the
+    header row, reading the file incrementally rather than all at once.
+    """
+    if upload.name.endswith('.xlsx'):
+        workbook = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = ['' if cell is None else str(cell).strip() for cell in next(rows, ())]
+            for row in rows:
+                yield {column: '' if value is None else str(value)
+                       for column, value in zip(header, row)}
+        finally:
+            workbook.close()
+    else:
+        yield from DictReader(iterdecode(upload, 'utf-8-sig'))
+
+
+def projection_rows(rows):
+    """
+    (name, projection) pairs from upload rows, which may use either
+    capitalized or lower-case column names.
+    """
+    for row in rows:
+        try:
+            player_name = row['Player']
+        except KeyError:
+            player_name = row['player']
+        try:
+            player_projection = float(row['Projection'])
+        except KeyError:
+            player_projection = float(row['projection'])
+        yield player_name, player_projection
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def alpha_only(name):
+    return ''.join(ch for ch in name if ch.isalpha())
+
+
+def name_scores(names, db_names, scorer):
+    """
+    names x db_names matrix of whole-number scores, computed on all
+    cores. Empty names score 0 against everything, as with fuzzywuzzy.
+    """
+    scores = np.rint(process.cdist(names, db_names, scorer=scorer, dtype=np.float64,
+                                   workers=-1))
+    scores[[not name for name in names], :] = 0
+    scores[:, [not name for name in db_names]] = 0
+    return scores
+
+
+def fuzzy_matches(names, candidates, banned_mappings):
+    """
+    For each name, the first slate player whose name is a close match,
+    either as written or with everything but letters stripped, or None.
+    All names are scored against all candidates at once; the slower
+    partial ratio is only taken for the pairs whose stripped names are
+    already close, with fuzzywuzzy's scorer so borderline names match
+    as they always have. candidates are (player, stripped name) pairs.
+    """
+    if not names or not candidates:
+        return [None] * len(names)
+    db_names = [player.name for player, _ in candidates]
+    stripped_db_names = [stripped for _, stripped in candidates]
+    stripped_names = [alpha_only(name) for name in names]
+    close = name_scores(names, db_names, fuzz.ratio) > 85
+    stripped_close = name_scores(stripped_names, stripped_db_names, fuzz.ratio) > 75
+    for i, j in np.argwhere(stripped_close & ~close):
+        close[i, j] = partial_ratio(stripped_names[i], stripped_db_names[j]) > 85
+    db_names = np.array(db_names, dtype=object)
+    for i, name in enumerate(names):
+        if name in banned_mappings:
+            close[i, db_names == banned_mappings[name]] = False
+    first = close.argmax(axis=1)
+    return [candidates[j][0] if close[i, j] else None for i, j in enumerate(first)]
+
+
+def apply_projections(sport, slate, user, rows, player_mappings, banned_mappings,
+                      batch_size=BATCH_SIZE):
+    """
+    Store a user's projections from (name, projection) rows. Names are
+    matched exactly, then through the sport's known mappings, then
+    fuzzily, all of a batch's unmatched names together. Rows are
+    consumed and written batch_size at a time, with one lookup, one bulk
+    update and one bulk insert of UserPlayer rows per batch, so memory
+    does not grow with the number of CSV rows. openpyxl still keeps about
+    80 bytes per XLSX row. Returns the assumed (fuzzy or mapped) matches
+    and the names not found.
+    """
+    Player = sport_model(sport, 'Player')
+    UserPlayer = sport_model(sport, 'UserPlayer')
+
+    all_players = list(Player.objects.filter(slate=slate, active=True))
+    by_name = {}
+    for player in all_players:
+        # Duplicate names are not an exact match, as with objects.get()
+        by_name[player.name] = None if player.name in by_name else player
+    candidates = [(player, alpha_only(player.name)) for player in all_players]
+
+    assumed_players = {}
+    unfound_players = []
+    for batch in batched(rows, batch_size):
+        unmatched = list({player_name: None for player_name, _ in batch
+                          if by_name.get(player_name) is None and player_name not in player_mappings})
+        fuzzy = dict(zip(unmatched, fuzzy_matches(unmatched, candidates, banned_mappings)))
+        projections = {}
+        for player_name, player_projection in batch:
+            meta_player = by_name.get(player_name)
+            if meta_player is None:
+                if player_name in player_mappings:
+                    meta_player = by_name.get(player_mappings[player_name])
+                    if meta_player is None:
+                        continue
+                else:
+                    meta_player = fuzzy.get(player_name)
+                    if meta_player is None:
+                        unfound_players.append(player_name)
+                        continue
+                assumed_players[player_name] = meta_player.name
+            projections[meta_player.id] = player_projection
+
+        with transaction.atomic():
+            existing = list(UserPlayer.objects.filter(
+                slate=slate, user=user, meta_player_id__in=projections))
+            for player in existing:
+                player.projection = projections[player.meta_player_id]
+            UserPlayer.objects.bulk_update(existing, ['projection'])
+            found = {player.meta_player_id for player in existing}
+            UserPlayer.objects.bulk_create([
+                UserPlayer(slate=slate, user=user, meta_player_id=player_id, lock=False,
+                           remove=False, ownership=0, exposure=100, projection=projection)
+                for player_id, projection in projections.items() if player_id not in found
+            ])
+    return assumed_players, unfound_players
@@ -24,4 +24,5 @@ urlpatterns = [
     path('mlb/', include('mlb.urls')),
     path('nfl/', include('nfl.urls')),
     path('api/ingest-dk-slate/', views.ingest_dk_slate, name='ingest-dk-slate'),
+    path('api/ingest-dk-slate/<str:sport>/<int:ingestion_id>/', views.ingest_status, name='ingest-status'),
 ]
@@ -4,16 +4,27 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 
-from nfl.management.commands.fetch_dk_slates import Command as FetchCommand
+from opto.dk_csv import check_columns
+from opto.rosters import sport_model
 
 INGEST_SECRET = os.environ.get('DK_INGEST_SECRET', '')
 VALID_SPORTS = {'NFL', 'NBA', 'MLB'} # only MLB and NFL stack
 
 
+def authorized(request):
+    secret = request.headers.get('X-Ingest-Key', '')
+    return bool(INGEST_SECRET) and secret == INGEST_SECRET
+
+
 @api_view(['POST'])
 def ingest_dk_slate(request):
-    secret = request.headers.get('X-Ingest-Key', '')
-    if not INGEST_SECRET or secret != INGEST_SECRET:
+    """
+    Validate a DK salary CSV and queue it for run_opto_worker, which does
+    the slate insert. A refresh needs the CSV's draft-group id and only
+    updates the slate that draft group created. Poll ingest_status with
+    the returned id.
+    """
+    if not authorized(request):
         return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
 
     sport = request.data.get('sport')
@@ -24,20 +35,44 @@ def ingest_dk_slate(request):
     if not csv_text:
         return Response({'error': 'Missing csv'}, status=status.HTTP_400_BAD_REQUEST)
 
-    cmd = FetchCommand()
-
-    if not cmd.is_classic_csv(csv_text, sport):
-        return Response({'skipped': True, 'reason': 'not a classic slate'})
-
+    refresh = str(request.data.get('refresh', '')).lower() in ('1', 'true')
+    draft_group = request.data.get('draft-group')
     try:
-        game_times, teams, games = cmd.parse_game_metadata(csv_text)
+        check_columns(csv_text)
+        if draft_group is not None:
+            draft_group = int(draft_group)
     except ValueError as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if refresh and draft_group is None:
+        return Response({'error': 'Refreshing a slate needs its draft-group id'},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    earliest_game = cmd.parse_earliest_game_dt(game_times)
+    ingestion = sport_model(sport, 'SlateIngestion').objects.create(
+        sport=sport,
+        csv=csv_text,
+        refresh=refresh,
+        draft_group_dk_id=draft_group,
+    )
+    return Response({'ingestion_id': ingestion.id, 'sport': sport, 'status': ingestion.status},
+                    status=status.HTTP_202_ACCEPTED)
 
-    if cmd.slate_exists(sport, earliest_game):
-        return Response({'skipped': True, 'reason': 'slate already exists'})
 
-    slate = cmd.create_slate(sport, csv_text, game_times, teams, games)
-    return Response({'created': True, 'slate_id': slate.id})
+@api_view(['GET'])
+def ingest_status(request, sport, ingestion_id):
+    if not authorized(request):
+        return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    if sport not in VALID_SPORTS:
+        return Response({'error': 'Invalid sport'}, status=status.HTTP_400_BAD_REQUEST)
+    SlateIngestion = sport_model(sport, 'SlateIngestion')
+    try:
+        ingestion = SlateIngestion.objects.get(pk=ingestion_id)
+    except SlateIngestion.DoesNotExist:
+        return Response({'error': 'Ingestion not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'id': ingestion.id,
+        'sport': ingestion.sport,
+        'status': ingestion.status,
+        'progress': ingestion.progress,
+        'result': ingestion.result,
+        'error': ingestion.error,
+    })
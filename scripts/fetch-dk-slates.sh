@@ -1,7 +1,10 @@
 #!/bin/bash
 # Fetch DraftKings Classic slates for NFL, NBA, and MLB.
-# Intended to be run daily via cron on the production server.
-# Logs are appended to /app/logs/fetch-dk-slates.log
+# Intended to be run via cron on the production server; draft groups whose
+# CSV has not changed since the last run are skipped before parsing, so it
+# is cheap to run every few minutes.
+# Logs are appended to /app/logs/fetch-dk-slates.log, with one JSON line per
+# ingestion phase. Run metrics go to the node_exporter textfile collector.
 
 set -e
 cd /app
@@ -9,5 +12,7 @@ cd /app
 cd opto
 
 echo "$(date '+%Y-%m-%d %H:%M:%S') — Starting fetch_dk_slates"
-DJANGO_SETTINGS_MODULE=opto.settings.prod python manage.py fetch_dk_slates
+METRICS_FILE=${INGEST_METRICS_FILE:-/var/lib/node_exporter/textfile_collector/opto_ingest.prom}
+DJANGO_SETTINGS_MODULE=opto.settings.prod python manage.py fetch_dk_slates --refresh --concurrent \
+    --metrics-file "$METRICS_FILE"
 echo "$(date '+%Y-%m-%d %H:%M:%S') — Done"
@@ -33,6 +33,7 @@ pip install -r /app/requirements.txt
 echo -e "\n>>> Running django migrations"
 pushd opto
 ./manage.py migrate
+./manage.py createcachetable
 
 echo -e "\n>>> Collecting static files"
 ./manage.py collectstatic --noinput
@@ -85,6 +85,7 @@ ssh root@$SERVER /bin/bash << EOF
     echo -e "\n>>> Runnin django migrations"
     pushd opto
     ./manage.py migrate
+    ./manage.py createcachetable
 
     echo -e "\n>>> Collecting static files"
     ./manage.py collectstatic --noinput